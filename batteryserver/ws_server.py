@@ -1,165 +1,243 @@
-import socket
-import hashlib
-import ubinascii
-import network
-import secrets
-import battery
-
-
-def accept_connection(server_socket):
-    client_socket, addr = server_socket.accept()
-    print(f"Connection from {addr}")
-
-    # Perform the WebSocket handshake
-    data = client_socket.recv(4096).decode('utf-8')
-    headers = data.split("\r\n")
-
-    # Extract key from headers
-    key = ''
-    for header in headers:
-        if "Sec-WebSocket-Key" in header:
-            key = header.split(": ")[1]
-
-    # Generate the accept key
-    accept_key = ubinascii.b2a_base64(hashlib.sha1((key + "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode()).digest()).decode("utf-8").strip()
-
-    # Send the handshake response
-    response = (
-        "HTTP/1.1 101 Switching Protocols\r\n"
-        "Upgrade: websocket\r\n"
-        "Connection: Upgrade\r\n"
-        f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
-    )
-    print("Sending response to handshake", response.encode())
-    client_socket.send(response.encode())
-
-    return client_socket
-
-
-def receive_data(client_socket):
-    data = client_socket.recv(1024)
-
-    print("Received data", data)
-
-    if len(data) == 0:
-        return None
-
-    # Parse the WebSocket frame
-    opcode_and_length = data[0]
-    payload_length = opcode_and_length & 127
-
-    if payload_length == 126:
-        payload_length = int.from_bytes(data[2:4], byteorder='big')
-        mask = data[4:8]
-        payload = data[8:]
-    elif payload_length == 127:
-        payload_length = int.from_bytes(data[2:10], byteorder='big')
-        mask = data[10:14]
-        payload = data[14:]
-    else:
-        mask = data[2:6]
-        payload = data[6:]
-
-    decoded_payload = bytearray()
-    for i in range(len(payload)):
-        decoded_payload.append(payload[i] ^ mask[i % 4])
-
-    return decoded_payload.decode('utf-8')
-
-
-def send_data(client_socket, message):
-    message = bytes(message, 'utf-8')
-    message_length = len(message)
-    send_data = bytearray([129])
-
-    if message_length <= 125:
-        send_data.append(message_length)
-    elif message_length <= 65535:
-        send_data.append(126)
-        send_data += message_length.to_bytes(2, byteorder='big')
-    else:
-        send_data.append(127)
-        send_data += message_length.to_bytes(8, byteorder='big')
-
-    send_data += message
-
-    return client_socket.send(send_data)
-
-
+import struct
 import time
-from machine import Pin, ADC
+import wifi
+import battery
+from wsframe import (handshake, FrameDecoder, FrameWriter, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING,
+                     OP_PONG, CLOSE_PROTOCOL_ERROR)
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
+class Client:
+    """
+    A websocket subscriber. Only the newest sample waiting to be sent is kept, so a slow client
+    skips samples rather than holding up the sampler or the other clients.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.frames = FrameWriter(writer)
+        self.pending = None
+        self.pending_opcode = OP_TEXT
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.control = []
+        self.closing = False
+        self.closed = False
+
+    def offer(self, payload, opcode=OP_TEXT):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = payload
+        self.pending_opcode = opcode
+        self.ready.set()
+
+    def send_control(self, opcode, payload=b''):
+        """
+        Queue a control frame ahead of any waiting sample. Sending a close frame ends the
+        connection once it's written
+        """
+        # The payload may be a view of the decoder's buffer, so keep a copy
+        self.control.append((opcode, bytes(payload)))
+        if opcode == OP_CLOSE:
+            self.closing = True
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.control:
+                    opcode, payload = self.control.pop(0)
+                    self.frames.write(payload, opcode)
+                if self.closing:
+                    await self.writer.drain()
+                    break
+                payload, self.pending = self.pending, None
+                if payload is None:
+                    continue
+                self.frames.write(payload, self.pending_opcode)
+                await self.writer.drain()
+        except Exception as e:
+            print('Error sending to client:', e)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Wake run() so it exits
+        self.ready.set()
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+MESSAGE_FORMAT = '{"percent": %s, "voltage": %s, "adc": %s}'
+
+# Binary telemetry frames are a header followed by count records. All little endian.
+TELEMETRY_VERSION = 1
+# version, count, sample rate (Hz), time of the first sample since the server started (ms),
+# volts per voltage unit, ADC reading per adc unit
+TELEMETRY_HEADER = '<BBfIff'
+# time since the first sample of the frame (ms), voltage, adc
+TELEMETRY_RECORD = '<Ihh'
+TELEMETRY_HEADER_SIZE = struct.calcsize(TELEMETRY_HEADER)
+TELEMETRY_RECORD_SIZE = struct.calcsize(TELEMETRY_RECORD)
+VOLTAGE_SCALE = 0.001
+# ADC readings are averages of 12 bit values, 1/8 keeps the fraction and still fits in an int16
+ADC_SCALE = 0.125
+
+
+def quantize(value, scale):
+    return max(-32768, min(32767, int(round(value / scale))))
+
+
+class BatteryServer:
+    """
+    Samples the battery every interval seconds and broadcasts it to every connected client. By
+    default each sample is sent as a JSON text frame. With binary, batch samples at a time are
+    sent as one binary telemetry frame (see TELEMETRY_HEADER), which allows much higher sample
+    rates.
+    """
+
+    def __init__(self, interval=1, binary=False, batch=10):
+        self.interval = interval
+        self.binary = binary
+        self.batch = batch
+        self.clients = []
+        self.frame = bytearray(TELEMETRY_HEADER_SIZE + batch * TELEMETRY_RECORD_SIZE)
+        self.count = 0
+        self.frame_start = 0
+
+    def broadcast(self, payload, opcode=OP_TEXT):
+        # Every client is sent the same payload object
+        for client in self.clients:
+            client.offer(payload, opcode)
+
+    def add_record(self, elapsed_ms, voltage, adc_value):
+        """
+        Add a sample to the binary frame being built, and broadcast the frame once it's full
+        """
+        if self.count == 0:
+            self.frame_start = elapsed_ms
+        offset = TELEMETRY_HEADER_SIZE + self.count * TELEMETRY_RECORD_SIZE
+        struct.pack_into(TELEMETRY_RECORD, self.frame, offset, elapsed_ms - self.frame_start,
+                         quantize(voltage, VOLTAGE_SCALE), quantize(adc_value, ADC_SCALE))
+        self.count += 1
+        if self.count < self.batch:
+            return
+        struct.pack_into(TELEMETRY_HEADER, self.frame, 0, TELEMETRY_VERSION, self.count,
+                         1 / self.interval, self.frame_start, VOLTAGE_SCALE, ADC_SCALE)
+        self.count = 0
+        # The frame buffer is reused, so the clients get a copy
+        self.broadcast(bytes(self.frame), OP_BINARY)
+        print(f"Sent {self.batch} samples to {len(self.clients)} clients")
+
+    async def sampler(self):
+        elapsed_ms = 0
+        last = time.ticks_ms()
+        while True:
+            adc_value, battery_percentage, battery_voltage = battery.get_battery_percentage()
+            now = time.ticks_ms()
+            elapsed_ms += time.ticks_diff(now, last)
+            last = now
+            if self.binary:
+                self.add_record(elapsed_ms, battery_voltage, adc_value)
+            else:
+                self.broadcast((MESSAGE_FORMAT % (battery_percentage, battery_voltage, adc_value)).encode(), OP_TEXT)
+                print(f"Sent: {battery_percentage}% {battery_voltage}V to {len(self.clients)} clients")
+            await asyncio.sleep(self.interval)
+
+    async def handle_client(self, reader, writer):
+        print(f"Connection from {writer.get_extra_info('peername')}")
+        try:
+            upgraded = await handshake(reader, writer)
+        except Exception as e:
+            print('Handshake failed:', e)
+            upgraded = False
+        if not upgraded:
+            writer.close()
+            return
+
+        client = Client(writer)
+        self.clients.append(client)
+        asyncio.create_task(client.run())
+        decoder = FrameDecoder()
+        try:
+            while not client.closing and not client.closed:
+                data = await reader.read(256)
+                if not data:
+                    break
+                for opcode, payload in decoder.feed(data):
+                    if opcode == OP_PING:
+                        client.send_control(OP_PONG, payload)
+                    elif opcode == OP_CLOSE:
+                        # Echo the status code back and let run() close the connection
+                        client.send_control(OP_CLOSE, payload[:2])
+                        break
+                    elif opcode == OP_TEXT:
+                        print("Received data", bytes(payload).decode('utf-8'))
+        except ValueError as e:
+            print('Protocol error from client:', e)
+            client.send_control(OP_CLOSE, CLOSE_PROTOCOL_ERROR.to_bytes(2, 'big'))
+        except Exception as e:
+            print('Error reading from client:', e)
+        finally:
+            if not client.closing:
+                client.close()
+            self.clients.remove(client)
+            print(f"Client disconnected, {client.dropped} stale samples dropped")
+
+    async def serve(self, host, port):
+        await asyncio.start_server(self.handle_client, host, port)
+        print(f"WebSocket server listening on {host}:{port}")
+        asyncio.create_task(rainbow())
+        await self.sampler()
+
+
+from machine import Pin
 from micropython import const
 import neopixel
 
 
-BATTERY_PIN = 10
-
 RGB_DATA = const(48)
 RGB_PWR = const(34)
 
-# Create a NeoPixel instance
-# Brightness of 0.3 is ample for the 1515 sized LED
-pixel = neopixel.NeoPixel(Pin(RGB_DATA), 1)
-
-# Create a colour wheel index int
-color_index = 0
-
-adc3 = ADC(Pin(BATTERY_PIN))  # Assign the ADC pin to read
-adc3.atten(ADC.ATTN_11DB)
-
-
-def websocket_server(host, port):
-    global color_index
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind((host, port))
-    server_socket.listen(5)
-
-    print(f"WebSocket server listening on {host}:{port}")
 
+async def rainbow():
+    # Create a NeoPixel instance
+    # Brightness of 0.3 is ample for the 1515 sized LED
+    pixel = neopixel.NeoPixel(Pin(RGB_DATA), 1)
     pixel[0] = (255, 0, 0, 0.5)
     pixel.write()
 
+    # Colour wheel index
+    color_index = 0
     while True:
-        client_socket = accept_connection(server_socket)
-
-        while True:
-            adc_value, battery_percentage, battery_voltage = battery.get_battery_percentage()
-            message = "{" + f'"percent": {battery_percentage}, "voltage": {battery_voltage}, "adc": {adc_value}' + "}"
-            send_bytes = send_data(client_socket, message)
-            print(f"Sent: {message} ({send_bytes} bytes)")
-
-            for i in range(66):
-                # Get the R,G,B values of the next colour
-                r, g, b = rgb_color_wheel(color_index)
-                # Set the colour on the NeoPixel
-                pixel[0] = (r, g, b, 0.5)
-                pixel.write()
-                # Increase the wheel index
-                color_index += 1
+        # Get the R,G,B values of the next colour
+        r, g, b = rgb_color_wheel(color_index)
+        # Set the colour on the NeoPixel
+        pixel[0] = (r, g, b, 0.5)
+        pixel.write()
+        # Increase the wheel index, looping at 255
+        color_index = (color_index + 1) % 255
 
-                # If the index == 255, loop it
-                if color_index == 255:
-                    color_index = 0
-                    # Invert the internal LED state every half colour cycle
-
-                # Sleep for 15ms so the colour cycle isn't too fast
-                time.sleep(0.015)
+        # Sleep for 15ms so the colour cycle isn't too fast
+        await asyncio.sleep(0.015)
 
 
 def do_connect():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    if not wlan.isconnected():
-        print(f'Connecting to {secrets.WIFI_SSID}')
-        wlan.connect(secrets.WIFI_SSID, secrets.WIFI_PASSWORD)
-        loop = 0
-        while not wlan.isconnected():
-            print(f'Connecting... {loop}')
-            time.sleep(0.5)
-            loop += 1
-    print('network config:', wlan.ifconfig())
-    return wlan.ifconfig()[0]
+    import secrets
+    config, _ = wifi.connect(secrets.WIFI_SSID, secrets.WIFI_PASSWORD)
+    print('network config:', config)
+    return config[0]
 
 
 def set_rgb_power(state):
@@ -182,12 +260,17 @@ def rgb_color_wheel(wheel_pos):
         return wheel_pos * 3, 255 - wheel_pos * 3, 0
 
 
-# Turn on the power to the NeoPixel
-set_rgb_power(True)
+def main():
+    # Turn on the power to the NeoPixel
+    set_rgb_power(True)
+
+    print("Starting websocket demo")
+    print("Establishing wifi connection")
+    local_ip = do_connect()
 
+    # Sample at 10Hz, sending a frame of 10 samples every second
+    asyncio.run(BatteryServer(interval=0.1, binary=True, batch=10).serve(local_ip, 8765))
 
-print("Starting websocket demo")
-print("Establishing wifi connection")
-local_ip = do_connect()
 
-websocket_server(local_ip, 8765)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+The websocket protocol: the opening handshake and frame encoding and decoding
+"""
+import binascii
+import hashlib
+import struct
+
+
+async def handshake(reader, writer):
+    """
+    Read the HTTP upgrade request and answer it. Returns False if it wasn't a websocket request
+    """
+    # Extract key from headers
+    key = ''
+    while True:
+        line = await reader.readline()
+        if not line or line == b'\r\n':
+            break
+        header = line.decode('utf-8').split(':', 1)
+        if len(header) == 2 and header[0].strip().lower() == 'sec-websocket-key':
+            key = header[1].strip()
+    if not key:
+        return False
+
+    # Generate the accept key
+    accept_key = binascii.b2a_base64(hashlib.sha1((key + "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode()).digest()).decode("utf-8").strip()
+
+    # Send the handshake response
+    response = (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
+    )
+    print("Sending response to handshake", response.encode())
+    writer.write(response.encode())
+    await writer.drain()
+    return True
+
+
+# Websocket opcodes
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_PROTOCOL_ERROR = 1002
+
+# Bytes unmasked per step, a multiple of the 4 byte mask
+UNMASK_BLOCK = 32
+
+
+def unmask(buf, mask):
+    """
+    XOR buf in place with the 4 byte mask, a block at a time rather than byte by byte
+    """
+    n = len(buf)
+    key = int.from_bytes(bytes(mask) * (UNMASK_BLOCK // 4), 'little')
+    end = n - n % UNMASK_BLOCK
+    for i in range(0, end, UNMASK_BLOCK):
+        block = int.from_bytes(buf[i:i + UNMASK_BLOCK], 'little') ^ key
+        buf[i:i + UNMASK_BLOCK] = block.to_bytes(UNMASK_BLOCK, 'little')
+    if end < n:
+        rest = n - end
+        block = int.from_bytes(buf[end:n], 'little') ^ (key & ((1 << (8 * rest)) - 1))
+        buf[end:n] = block.to_bytes(rest, 'little')
+
+
+class FrameDecoder:
+    """
+    Incremental websocket frame parser. feed() takes whatever bytes have arrived, however they're
+    split, and yields (opcode, payload) for every complete message and control frame. Fragmented
+    messages are reassembled. Frames are read into preallocated buffers, so payload is a
+    memoryview that is only valid until the next one is yielded. Raises ValueError on a protocol
+    error or a frame or message longer than max_payload.
+    """
+
+    def __init__(self, max_payload=1024):
+        self.header = bytearray(14)
+        self.frame = bytearray(max_payload)
+        self.message = bytearray(max_payload)
+        self.message_opcode = None
+        self.message_length = 0
+        self.mask = None
+        self.opcode = 0
+        self.fin = False
+        # length is None while reading the header
+        self.length = None
+        self.have = 0
+        self.need = 2
+
+    def feed(self, data):
+        data = memoryview(data)
+        i = 0
+        n = len(data)
+        while True:
+            if self.have == self.need:
+                if self.length is None:
+                    self._header_done()
+                else:
+                    result = self._frame_done()
+                    if result:
+                        yield result
+                continue
+            if i == n:
+                return
+            k = min(self.need - self.have, n - i)
+            buf = self.header if self.length is None else self.frame
+            buf[self.have:self.have + k] = data[i:i + k]
+            self.have += k
+            i += k
+
+    def _header_done(self):
+        h = self.header
+        length = h[1] & 0x7F
+        masked = h[1] & 0x80
+        size = 2 + (2 if length == 126 else 8 if length == 127 else 0) + (4 if masked else 0)
+        if self.need < size:
+            # Read the extended length and the mask
+            self.need = size
+            return
+        if length == 126:
+            length = int.from_bytes(h[2:4], 'big')
+        elif length == 127:
+            length = int.from_bytes(h[2:10], 'big')
+        if length > len(self.frame):
+            raise ValueError('Frame too big')
+        self.fin = bool(h[0] & 0x80)
+        self.opcode = h[0] & 0x0F
+        self.mask = h[size - 4:size] if masked else None
+        self.length = length
+        self.have = 0
+        self.need = length
+
+    def _frame_done(self):
+        payload = memoryview(self.frame)[:self.length]
+        if self.mask:
+            unmask(payload, self.mask)
+        opcode = self.opcode
+        self.length = None
+        self.have = 0
+        self.need = 2
+
+        if opcode >= OP_CLOSE:
+            # Control frames can come between the fragments of a message
+            if not self.fin:
+                raise ValueError('Fragmented control frame')
+            return opcode, payload
+        if opcode == OP_CONTINUATION:
+            if self.message_opcode is None:
+                raise ValueError('Unexpected continuation frame')
+        else:
+            if self.message_opcode is not None:
+                raise ValueError('Expected a continuation frame')
+            if self.fin:
+                return opcode, payload
+            self.message_opcode = opcode
+            self.message_length = 0
+
+        end = self.message_length + len(payload)
+        if end > len(self.message):
+            raise ValueError('Message too big')
+        self.message[self.message_length:end] = payload
+        self.message_length = end
+        if not self.fin:
+            return None
+        opcode, self.message_opcode = self.message_opcode, None
+        return opcode, memoryview(self.message)[:end]
+
+
+class FrameWriter:
+    """
+    Writes websocket frames to a stream. The header is built in a preallocated buffer and written
+    separately from the payload, so no header + payload frame is allocated. This isn't zero-copy
+    on the board: uasyncio's Stream.write copies whatever the socket doesn't take straight away
+    into its out_buf (older uasyncio copies every write), so a payload is still copied once there.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.header = bytearray(10)
+        self.header_view = memoryview(self.header)
+        # asyncio on CPython keeps a reference to data it can't send straight away, so the reused
+        # header has to be copied there. uasyncio copies unsent data into its out_buf itself
+        self.copy_header = hasattr(stream, 'transport')
+
+    def write(self, payload, opcode=OP_TEXT):
+        """
+        Write one unfragmented frame. payload is bytes-like and mustn't change until it's sent
+        """
+        length = len(payload)
+        h = self.header
+        h[0] = 0x80 | opcode
+        if length <= 125:
+            h[1] = length
+            size = 2
+        elif length <= 0xFFFF:
+            h[1] = 126
+            struct.pack_into('>H', h, 2, length)
+            size = 4
+        else:
+            h[1] = 127
+            struct.pack_into('>Q', h, 2, length)
+            size = 10
+        header = self.header_view[:size]
+        self.stream.write(bytes(header) if self.copy_header else header)
+        if length:
+            self.stream.write(payload)
@@ -0,0 +1,400 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "batteryserver"), ROOT]
+
+
+def measure(fn, repeat):
+    """
+    Return (mean seconds per call, peak bytes allocated by one call)
+    """
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat, peak
+
+
+def get_updates_response(count):
+    """
+    A getUpdates response holding count messages, like the one the board downloads
+    """
+    updates = [{
+        "update_id": 100000 + i,
+        "message": {
+            "message_id": i,
+            "from": {"id": 1234, "is_bot": False, "first_name": "Someone", "language_code": "en"},
+            "chat": {"id": 1234, "first_name": "Someone", "type": "private"},
+            "date": 1700000000 + i,
+            "text": f"/set {i % 10} {i % 5}",
+        },
+    } for i in range(count)]
+    return json.dumps({"ok": True, "result": updates}).encode()
+
+
+def bench_jsonscan(args):
+    from jsonscan import JSONScanner
+    from telegram import _LastUpdate
+
+    print(f"{'updates':>8} {'bytes':>8} {'json.loads':>20} {'JSONScanner':>20}")
+    for count in args.updates:
+        data = get_updates_response(count)
+
+        def scan():
+            last = _LastUpdate()
+            scanner = JSONScanner(last, last.wanted)
+            view = memoryview(data)
+            # The board feeds the scanner from a 512 byte read buffer
+            for i in range(0, len(data), 512):
+                scanner.feed(view[i:i + 512])
+
+        loads_s, loads_peak = measure(lambda: json.loads(data), args.repeat)
+        scan_s, scan_peak = measure(scan, args.repeat)
+        print(f"{count:>8} {len(data):>8} {loads_s * 1000:>8.2f}ms {loads_peak / 1024:>7.1f}KiB "
+              f"{scan_s * 1000:>8.2f}ms {scan_peak / 1024:>7.1f}KiB")
+
+
+def masked_frame(payload, mask):
+    """
+    A masked binary frame with a 64 bit length, as a browser sends a large message
+    """
+    header = bytes([0x82, 0x80 | 127]) + len(payload).to_bytes(8, "big") + mask
+    return header + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def bench_unmask(args):
+    from wsframe import unmask, FrameDecoder
+
+    mask = b"\x12\x34\x56\x78"
+    print(f"{'size':>8} {'per byte':>12} {'unmask':>12} {'FrameDecoder':>14}")
+    for size in args.sizes:
+        payload = os.urandom(size)
+        buf = bytearray(payload)
+
+        def per_byte():
+            for i in range(len(buf)):
+                buf[i] ^= mask[i & 3]
+
+        frame = masked_frame(payload, mask)
+        decoder = FrameDecoder(max_payload=size)
+
+        def decode():
+            # Fed in 1460 byte pieces, a TCP segment at a time
+            view = memoryview(frame)
+            for i in range(0, len(frame), 1460):
+                for _ in decoder.feed(view[i:i + 1460]):
+                    pass
+
+        per_byte_s, _ = measure(per_byte, args.repeat)
+        unmask_s, _ = measure(lambda: unmask(memoryview(buf), mask), args.repeat)
+        decode_s, _ = measure(decode, args.repeat)
+        print(f"{size:>8} {size / per_byte_s / 1e6:>8.1f}MB/s {size / unmask_s / 1e6:>8.1f}MB/s "
+              f"{size / decode_s / 1e6:>10.1f}MB/s")
+
+
+def legacy_read_until(pyb, min_num_bytes, ending, timeout=10, data_consumer=None):
+    """
+    Pyboard.read_until as it was before it buffered reads: one byte per read, sleeping 10ms
+    whenever nothing is waiting
+    """
+    data = pyb.serial.read(min_num_bytes)
+    if data_consumer:
+        data_consumer(data)
+    timeout_count = 0
+    while True:
+        if data.endswith(ending):
+            break
+        elif pyb.serial.inWaiting() > 0:
+            new_data = pyb.serial.read(1)
+            if data_consumer:
+                data_consumer(new_data)
+                data = new_data
+            else:
+                data = data + new_data
+            timeout_count = 0
+        else:
+            timeout_count += 1
+            if timeout is not None and timeout_count >= 100 * timeout:
+                break
+            time.sleep(0.01)
+    return data
+
+
+class SyscallCounter:
+    """
+    Counts the reads, polls, ioctls and sleeps made while reading from a ProcessToSerial
+    """
+
+    def __init__(self, serial):
+        self.count = 0
+        self.serial = serial
+        counter = self
+
+        class Counted:
+            def __init__(self, target):
+                self.target = target
+
+            def __getattr__(self, name):
+                attr = getattr(self.target, name)
+                if name not in ("read", "poll"):
+                    return attr
+
+                def call(*args):
+                    counter.count += 1
+                    return attr(*args)
+                return call
+
+        self.stdout = serial.subp.stdout
+        self.poll = serial.poll
+        self.counted_stdout = Counted(self.stdout)
+        self.counted_poll = Counted(self.poll)
+
+    def _count(self, fn):
+        def call(*args, **kwargs):
+            self.count += 1
+            return fn(*args, **kwargs)
+        return call
+
+    def __enter__(self):
+        import fcntl
+        self.ioctl = fcntl.ioctl
+        self.sleep = time.sleep
+        fcntl.ioctl = self._count(self.ioctl)
+        time.sleep = self._count(self.sleep)
+        self.serial.subp.stdout = self.counted_stdout
+        self.serial.poll = self.counted_poll
+        return self
+
+    def __exit__(self, *args):
+        import fcntl
+        fcntl.ioctl = self.ioctl
+        time.sleep = self.sleep
+        self.serial.subp.stdout = self.stdout
+        self.serial.poll = self.poll
+
+
+def bench_read_until(args):
+    import threading
+    import pyboard
+
+    print(f"{'size':>8} {'old':>10} {'syscalls':>9} {'new':>10} {'syscalls':>9}")
+    for size in args.sizes:
+        row = []
+        for read_until in (legacy_read_until, pyboard.Pyboard.read_until):
+            # cat echoes whatever is written, standing in for a board printing output
+            pyb = pyboard.Pyboard("exec:cat")
+            try:
+                payload = bytes(b"0123456789abcdef"[i % 16] for i in range(size)) + b"\x04"
+                writer = threading.Thread(target=pyb.serial.write, args=(payload,))
+                received = bytearray()
+                with SyscallCounter(pyb.serial) as counter:
+                    start = time.perf_counter()
+                    writer.start()
+                    read_until(pyb, 1, b"\x04", data_consumer=received.extend)
+                    elapsed = time.perf_counter() - start
+                writer.join()
+                assert received == payload, "output was not read back intact"
+                row += [elapsed, counter.count]
+            finally:
+                pyb.close()
+        print(f"{size:>8} {row[0] * 1000:>8.1f}ms {row[1]:>9} {row[2] * 1000:>8.1f}ms {row[3]:>9}")
+
+
+class WireCounter:
+    """
+    Counts the bytes written to and read from a Pyboard's serial connection
+    """
+
+    def __init__(self, serial):
+        self.written = self.read = 0
+        write, read = serial.write, serial.read
+
+        def counted_write(data):
+            self.written += len(data)
+            return write(data)
+
+        def counted_read(size=1):
+            data = read(size)
+            self.read += len(data)
+            return data
+
+        serial.write = counted_write
+        serial.read = counted_read
+
+
+def transfer_samples(size):
+    """
+    (name, data) pairs to transfer: source code, which deflates well, and random bytes, which don't
+    """
+    source = b"".join(open(os.path.join(ROOT, "src", name), "rb").read()
+                      for name in sorted(os.listdir(os.path.join(ROOT, "src"))) if name.endswith(".py"))
+    return [("source", (source * (size // len(source) + 1))[:size]), ("random", os.urandom(size))]
+
+
+def bench_transfer(args):
+    import tempfile
+    import pyboard
+
+    print(f"{'data':>7} {'size':>8} {'transfer':>10} {'put wire':>9} {'put':>9} {'get wire':>9} {'get':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        board = os.path.join(tmp, "board")
+        os.mkdir(board)
+        src = os.path.join(tmp, "src")
+        back = os.path.join(tmp, "back")
+        for size in args.sizes:
+            for name, data in transfer_samples(size):
+                with open(src, "wb") as f:
+                    f.write(data)
+                for compress in (False, True):
+                    # tests/rawrepl.py stands in for the board
+                    pyb = pyboard.Pyboard("exec:%s %s %s" % (sys.executable,
+                                                             os.path.join(ROOT, "tests", "rawrepl.py"), board))
+                    try:
+                        pyb.enter_raw_repl()
+                        pyb.use_compression = compress
+                        wire = WireCounter(pyb.serial)
+                        start = time.perf_counter()
+                        pyb.fs_put(src, "data.bin")
+                        put_s = time.perf_counter() - start
+                        put_bytes = wire.written
+                        wire.read = 0
+                        start = time.perf_counter()
+                        pyb.fs_get("data.bin", back)
+                        get_s = time.perf_counter() - start
+                        get_bytes = wire.read
+                    finally:
+                        pyb.close()
+                    with open(back, "rb") as f:
+                        assert f.read() == data, "file did not round trip"
+                    print(f"{name:>7} {size:>8} {'deflate' if compress else 'plain':>10} {put_bytes:>9} "
+                          f"{put_s * 1000:>7.1f}ms {get_bytes:>9} {get_s * 1000:>7.1f}ms")
+
+
+WAKES = {"reset": 0, "pin": 2, "timer": 4}
+
+
+def bench_imports(args):
+    import builtins
+    import contextlib
+    import io
+    import tempfile
+
+    fakes = os.path.join(ROOT, "tests", "fakes")
+    sys.path.insert(0, fakes)
+    import machine
+    # time's MicroPython extensions on the fake board's clock, as in tests/conftest.py
+    time.ticks_us = lambda: machine.now_us
+    time.ticks_ms = lambda: machine.now_us // 1000
+    time.ticks_diff = lambda end, start: end - start
+    time.sleep_us = machine.advance
+    time.sleep_ms = lambda ms: machine.advance(ms * 1000)
+    time.sleep = lambda s: machine.advance(int(s * 1000000))
+    # keep the vibration going so the timer wake keeps polling rather than notifying
+    machine.signal = lambda t: (800, -800, 800) if int(t * 2.2) % 2 else (-800, 800, -800)
+    booted = set(sys.modules)
+
+    loaded = []
+    # time spent in nested imports, so each module is charged only for its own
+    nested = [0.0]
+    real_import = builtins.__import__
+
+    def timed_import(name, *a, **kw):
+        if name in sys.modules:
+            return real_import(name, *a, **kw)
+        nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return real_import(name, *a, **kw)
+        finally:
+            elapsed = time.perf_counter() - start
+            loaded.append((name, elapsed - nested.pop()))
+            nested[-1] += elapsed
+
+    def where(name):
+        path = getattr(sys.modules.get(name), "__file__", None) or ""
+        if path.startswith(fakes):
+            return "built in"
+        return "src" if path.startswith(os.path.join(ROOT, "src")) else "stdlib"
+
+    # fastest of the repeats for each wake and module, in import order
+    results = {wake: {} for wake in WAKES}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        for _ in range(args.repeat):
+            machine.reset()
+            for wake, reason in WAKES.items():
+                # a deep sleep forgets every module, only RTC memory survives
+                for name in set(sys.modules) - booted:
+                    del sys.modules[name]
+                machine.set_wake_reason(reason)
+                loaded.clear()
+                builtins.__import__ = timed_import
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        import washing
+                        washing.run()
+                except machine.DeepSleep:
+                    pass
+                finally:
+                    builtins.__import__ = real_import
+                for name, elapsed in loaded:
+                    seen = results[wake].setdefault(name, [elapsed, where(name)])
+                    seen[0] = min(seen[0], elapsed)
+
+    for wake, modules in results.items():
+        total = sum(elapsed for elapsed, kind in modules.values())
+        print(f"{wake} wake: {len(modules)} imports")
+        for name, (elapsed, kind) in modules.items():
+            print(f"  {name:<12} {kind:<9} {elapsed * 1000:>8.3f}ms")
+        print(f"  {'total':<22} {total * 1000:>8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host-side benchmarks. Times are CPython's; compare them "
+                                                 "relative to each other, the board is much slower.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    jsonscan = subparsers.add_parser("jsonscan", help="scanning a getUpdates response vs json.loads, "
+                                                      "time and peak allocation")
+    jsonscan.add_argument("--updates", type=int, nargs="+", default=[1, 10, 100, 1000],
+                          help="numbers of updates in the response")
+    jsonscan.add_argument("--repeat", type=int, default=20)
+    jsonscan.set_defaults(run=bench_jsonscan)
+
+    unmask = subparsers.add_parser("unmask", help="websocket unmasking and frame decoding throughput")
+    unmask.add_argument("--sizes", type=int, nargs="+", default=[1024, 65536, 1 << 20],
+                        help="payload sizes in bytes")
+    unmask.add_argument("--repeat", type=int, default=5)
+    unmask.set_defaults(run=bench_unmask)
+
+    read_until = subparsers.add_parser("read_until", help="Pyboard.read_until before and after buffering reads, "
+                                                          "echoing through a ProcessToSerial")
+    read_until.add_argument("--sizes", type=int, nargs="+", default=[1024, 16384, 200000],
+                            help="output sizes in bytes")
+    read_until.set_defaults(run=bench_read_until)
+
+    transfer = subparsers.add_parser("transfer", help="bytes on the wire and time of fs_put/fs_get with and "
+                                                      "without deflate, against tests/rawrepl.py")
+    transfer.add_argument("--sizes", type=int, nargs="+", default=[4096, 65536],
+                          help="file sizes in bytes")
+    transfer.set_defaults(run=bench_transfer)
+
+    imports = subparsers.add_parser("imports", help="modules each wake reason imports and their import "
+                                                    "times, running washing.py on the fakes in tests/fakes")
+    imports.add_argument("--repeat", type=int, default=20)
+    imports.set_defaults(run=bench_imports)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,65 @@
+import argparse
 import ast
+import glob
 import hashlib
 import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import pyboard
 
+MANIFEST_FILE = "manifest.json"
+HASH_CHUNK_SIZE = 512
+MPY_CACHE_DIR = ".mpy-cache"
+# Files that must stay as source on the device (the firmware only runs main.py, not main.mpy)
+SOURCE_ONLY = {"main.py"}
+
 
 def file_hashes(pyb):
+    """
+    Return a list of (name, size, mtime, sha256) for every file in / on the device. Files whose
+    size and mtime match the device's manifest reuse the stored hash, everything else is hashed
+    in fixed-size chunks so large files never have to fit in the heap.
+    """
     buffer = bytearray()
 
-    def read_data(byte):
-        if byte != b'\x04':
-            buffer.extend(byte)
+    def read_data(data):
+        # data is a chunk of output, the last one ends with the \x04 end of output marker
+        buffer.extend(data.replace(b'\x04', b''))
 
     cmd = f"""
 import uos
-import hashlib
+import uhashlib
 import ubinascii
+import json
+
+try:
+  with open('{MANIFEST_FILE}') as f:
+    manifest = json.load(f)
+except (OSError, ValueError):
+  manifest = {{}}
 
+buf = bytearray({HASH_CHUNK_SIZE})
 files = []
-for f in uos.listdir('/'):
-  sha = hashlib.sha256()
-  with open(f, 'rb') as f2:
-    sha.update(f2.read())
-  files.append((f, ubinascii.hexlify(sha.digest()).decode('ascii')))
+for entry in uos.ilistdir('/'):
+  name = entry[0]
+  if entry[1] & 0x4000 or name == '{MANIFEST_FILE}':
+    continue
+  st = uos.stat(name)
+  cached = manifest.get(name)
+  if cached and cached[0] == st[6] and cached[1] == st[8]:
+    digest = cached[2]
+  else:
+    sha = uhashlib.sha256()
+    with open(name, 'rb') as f2:
+      while True:
+        n = f2.readinto(buf)
+        if not n:
+          break
+        sha.update(memoryview(buf)[:n])
+    digest = ubinascii.hexlify(sha.digest()).decode('ascii')
+  files.append((name, st[6], st[8], digest))
 print(files)
     """
     pyb.exec_(cmd, data_consumer=read_data)
@@ -30,29 +67,182 @@ print(files)
     return ast.literal_eval(output)
 
 
+def write_manifest(pyb, files, copied):
+    """
+    Write the device manifest from the listing returned by file_hashes, replacing the entries of
+    the copied files (name -> local sha256) with their new size and mtime.
+    """
+    manifest = {name: [size, mtime, digest] for name, size, mtime, digest in files}
+    cmd = f"""
+import uos
+import json
+
+manifest = {manifest!r}
+for name, digest in {copied!r}.items():
+  st = uos.stat(name)
+  manifest[name] = [st[6], st[8], digest]
+with open('{MANIFEST_FILE}', 'w') as f:
+  json.dump(manifest, f)
+    """
+    pyb.exec_(cmd)
+
+
 def file_hash(f):
     sha = hashlib.sha256()
     with open(f, 'rb') as f2:
-        sha.update(f2.read())
+        for chunk in iter(lambda: f2.read(HASH_CHUNK_SIZE * 8), b''):
+            sha.update(chunk)
     return sha.hexdigest()
 
 
-serial_device = "/dev/ttyACM0"
-source_dir = "src"
+def mpy_cross_version(mpy_cross):
+    return subprocess.run([mpy_cross, "--version"], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def build_artifacts(source_dir, mpy_cross=None, cache_dir=MPY_CACHE_DIR):
+    """
+    Return a list of (local path, device file name) for the files to push. With mpy_cross set,
+    sources are compiled to .mpy and cached in cache_dir, keyed by the source hash and the
+    mpy-cross version so a file is only recompiled when it or the compiler changes.
+    """
+    version = mpy_cross_version(mpy_cross) if mpy_cross else None
+    artifacts = []
+    for source_file in sorted(os.listdir(source_dir)):
+        if not source_file.endswith(".py"):
+            continue
+        source_path = f"{source_dir}/{source_file}"
+        if version is None or source_file in SOURCE_ONLY:
+            artifacts.append((source_path, source_file))
+            continue
+        key = hashlib.sha256(f"{file_hash(source_path)}:{version}".encode()).hexdigest()[:32]
+        mpy_path = os.path.join(cache_dir, f"{source_file[:-3]}-{key}.mpy")
+        if not os.path.exists(mpy_path):
+            print(f"Compiling {source_path}")
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = mpy_path + ".tmp"
+            subprocess.run([mpy_cross, "-s", source_file, "-o", tmp_path, source_path], check=True)
+            os.replace(tmp_path, mpy_path)
+        artifacts.append((mpy_path, source_file[:-3] + ".mpy"))
+    return artifacts
+
+
+def counterpart(name):
+    """foo.py <-> foo.mpy"""
+    if name.endswith(".mpy"):
+        return name[:-4] + ".py"
+    return name[:-3] + ".mpy"
+
+
+def push(device, artifacts, log=print, compress=False):
+    """
+    Push any changed artifacts (see build_artifacts) to the board at device (a serial port or the
+    IP address of a board running telnet) and soft-reset it. Returns the list of copied files.
+    """
+    pyb = pyboard.Pyboard(device)
+    pyb.use_compression = compress
+    try:
+        pyb.enter_raw_repl(soft_reset=False)
+        device_files = file_hashes(pyb)
+        file_hash_map = {f[0]: f[3] for f in device_files}
+        copied = {}
+        for local_path, name in artifacts:
+            local_hash = file_hash(local_path)
+            if not (name in file_hash_map) or local_hash != file_hash_map[name]:
+                log(f"Copying {local_path} to {name}")
+                pyb.fs_put(local_path, name)
+                copied[name] = local_hash
+            else:
+                log(f"File hashes match: {name} {local_hash}")
+            # A stale foo.py would be imported in preference to foo.mpy, and vice versa is dead weight
+            stale = counterpart(name)
+            if stale in file_hash_map:
+                log(f"Removing {stale}")
+                pyb.fs_rm(stale)
+                device_files = [f for f in device_files if f[0] != stale]
+        write_manifest(pyb, device_files, copied)
+        pyb.exit_raw_repl()
+        # Write ctrl-D to trigger a soft-reset
+        pyb.serial.write(b"\x04")
+    finally:
+        pyb.close()
+    return sorted(copied)
+
+
+def expand_devices(patterns):
+    devices = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            devices.extend(sorted(glob.glob(pattern)))
+        else:
+            devices.append(pattern)
+    return devices
+
+
+def push_all(devices, artifacts, jobs=8, compress=False):
+    """
+    Push to all devices concurrently. A failure on one board doesn't affect the others; returns a
+    dict of device -> (copied files, None) or (None, exception).
+    """
+    def push_one(device):
+        def log(message):
+            print(f"[{device}] {message}" if len(devices) > 1 else message)
+        return push(device, artifacts, log, compress)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(devices)))) as executor:
+        futures = {device: executor.submit(push_one, device) for device in devices}
+        for device, future in futures.items():
+            try:
+                results[device] = (future.result(), None)
+            except Exception as e:
+                results[device] = (None, e)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the project sources to one or more boards.")
+    parser.add_argument(
+        "devices",
+        nargs="*",
+        default=["/dev/ttyACM0"],
+        help="serial devices, globs of serial devices (e.g. '/dev/ttyACM*') or board IP addresses",
+    )
+    parser.add_argument("-s", "--source-dir", default="src", help="directory of files to push")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="number of boards to push to at once")
+    parser.add_argument(
+        "--mpy",
+        nargs="?",
+        const="mpy-cross",
+        metavar="MPY_CROSS",
+        help="precompile sources (except main.py) to .mpy with mpy-cross before pushing",
+    )
+    parser.add_argument(
+        "--compress", action="store_true", help="deflate uploads when the firmware supports it"
+    )
+    args = parser.parse_args()
+
+    devices = expand_devices(args.devices)
+    if not devices:
+        print("No devices found")
+        sys.exit(1)
+
+    artifacts = build_artifacts(args.source_dir, args.mpy)
+    results = push_all(devices, artifacts, args.jobs, args.compress)
 
-pyb = pyboard.Pyboard(serial_device)
-pyb.enter_raw_repl(soft_reset=False)
-file_hash_map = {f[0]: f[1] for f in file_hashes(pyb)}
-for source_file in os.listdir(source_dir):
-    if source_file.endswith(".py"):
-        source_hash = file_hash(f"{source_dir}/{source_file}")
-        if not (source_file in file_hash_map) or source_hash != file_hash_map[source_file]:
-            print(f"Copying {source_dir}/{source_file}")
-            pyboard.filesystem_command(pyb, ["cp", f"{source_dir}/{source_file}", ":"])
+    print()
+    print("Deploy report:")
+    failed = 0
+    for device, (copied, error) in results.items():
+        if error is not None:
+            failed += 1
+            print(f"  {device}: FAILED ({error!r})")
+        elif copied:
+            print(f"  {device}: copied {', '.join(copied)}")
         else:
-            print("File hashes match:", source_file, source_hash)
-pyb.exit_raw_repl()
-# Write ctrl-D to trigger a soft-reset
-pyb.serial.write(b"\x04")
+            print(f"  {device}: up to date")
+    if failed:
+        sys.exit(1)
 
 
+if __name__ == "__main__":
+    main()
@@ -71,6 +71,7 @@ import sys
 import time
 import os
 import ast
+import struct
 
 try:
     stdout = sys.stdout.buffer
@@ -153,6 +154,13 @@ class TelnetToSerial:
         else:
             return n_waiting
 
+    def wait_readable(self, timeout):
+        import select
+
+        if self.inWaiting():
+            return True
+        return bool(select.select([self.tn], [], [], timeout)[0])
+
 
 class ProcessToSerial:
     "Execute a process and emulate serial connection using its stdin/stdout."
@@ -202,9 +210,19 @@ class ProcessToSerial:
         # res = self.sel.select(0)
         res = self.poll.poll(0)
         if res:
-            return 1
+            # Report the real number of buffered bytes so callers can drain them in one read.
+            import fcntl
+            import struct
+            import termios
+
+            buf = fcntl.ioctl(self.subp.stdout.fileno(), termios.FIONREAD, b"\0\0\0\0")
+            return max(struct.unpack("i", buf)[0], 1)
         return 0
 
+    def wait_readable(self, timeout):
+        res = self.poll.poll(None if timeout is None else int(timeout * 1000))
+        return bool(res)
+
 
 class ProcessPtyToTerminal:
     """Execute a process which creates a PTY and prints slave PTY as
@@ -250,6 +268,13 @@ class ProcessPtyToTerminal:
     def inWaiting(self):
         return self.ser.inWaiting()
 
+    def wait_readable(self, timeout):
+        import select
+
+        if self.ser.inWaiting():
+            return True
+        return bool(select.select([self.ser], [], [], timeout)[0])
+
 
 class Pyboard:
     def __init__(
@@ -257,6 +282,13 @@ class Pyboard:
     ):
         self.in_raw_repl = False
         self.use_raw_paste = True
+        self.use_bulk_put = True
+        # deflate fs_put/fs_get transfers when the firmware supports it
+        self.use_compression = False
+        # window size negotiated by the last raw-paste exec, if any
+        self.raw_paste_window = None
+        # bytes received from the device but not yet consumed by a reader
+        self.rx_buf = bytearray()
         if device.startswith("exec:"):
             self.serial = ProcessToSerial(device[len("exec:") :])
         elif device.startswith("execpty:"):
@@ -297,36 +329,94 @@ class Pyboard:
     def close(self):
         self.serial.close()
 
+    def read(self, size=1):
+        # Serve buffered bytes first, then block on the device for the remainder
+        if not self.rx_buf:
+            return self.serial.read(size)
+        data = bytes(self.rx_buf[:size])
+        del self.rx_buf[:size]
+        if len(data) < size:
+            data += self.serial.read(size - len(data))
+        return data
+
+    def in_waiting(self):
+        return len(self.rx_buf) + self.serial.inWaiting()
+
+    def read_available(self, timeout):
+        """
+        Return all bytes currently available, waiting up to timeout seconds (None waits
+        forever) for at least one byte to arrive.  Returns b"" on timeout.
+        """
+        if self.rx_buf:
+            data = bytes(self.rx_buf)
+            self.rx_buf = bytearray()
+            return data
+        n = self.serial.inWaiting()
+        if n:
+            return self.serial.read(n)
+        wait_readable = getattr(self.serial, "wait_readable", None)
+        if wait_readable is not None:
+            if not wait_readable(timeout):
+                return b""
+            return self.serial.read(max(self.serial.inWaiting(), 1))
+        # pyserial: block in read() using the port's own timeout
+        prev_timeout = self.serial.timeout
+        self.serial.timeout = timeout
+        try:
+            data = self.serial.read(1)
+        finally:
+            self.serial.timeout = prev_timeout
+        n = self.serial.inWaiting()
+        if data and n:
+            data += self.serial.read(n)
+        return data
+
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
-        # if data_consumer is used then data is not accumulated and the ending must be 1 byte long
+        # if data_consumer is used then data is not accumulated and the ending must be 1 byte long.
+        # The consumer is called with chunks of whatever size arrived (not single bytes) and the
+        # last chunk includes the ending, so consumers must strip it from anywhere in a chunk
+        # rather than compare whole chunks against it.
         assert data_consumer is None or len(ending) == 1
 
-        data = self.serial.read(min_num_bytes)
-        if data_consumer:
-            data_consumer(data)
-        timeout_count = 0
+        data = bytearray(self.read(min_num_bytes))
+        # the ending can only match once at least min_num_bytes have been read
+        search_from = max(0, min_num_bytes - len(ending))
+        deadline = None if timeout is None else time.monotonic() + timeout
         while True:
-            if data.endswith(ending):
-                break
-            elif self.serial.inWaiting() > 0:
-                new_data = self.serial.read(1)
+            end = data.find(ending, search_from)
+            if end >= 0:
+                end += len(ending)
+                # keep anything after the ending for the next reader
+                self.rx_buf[:0] = data[end:]
+                del data[end:]
                 if data_consumer:
-                    data_consumer(new_data)
-                    data = new_data
-                else:
-                    data = data + new_data
-                timeout_count = 0
+                    data_consumer(bytes(data))
+                    return bytes(ending)
+                return bytes(data)
+            if data_consumer:
+                # the ending is 1 byte so nothing read so far can be part of it
+                data_consumer(bytes(data))
+                data = bytearray()
+                search_from = 0
             else:
-                timeout_count += 1
-                if timeout is not None and timeout_count >= 100 * timeout:
-                    break
-                time.sleep(0.01)
-        return data
+                search_from = max(0, len(data) - len(ending) + 1)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            new_data = self.read_available(remaining)
+            if new_data:
+                data.extend(new_data)
+                if deadline is not None:
+                    deadline = time.monotonic() + timeout
+        if data_consumer:
+            return b""
+        return bytes(data)
 
     def enter_raw_repl(self, soft_reset=True):
         self.serial.write(b"\r\x03\x03")  # ctrl-C twice: interrupt any running program
 
         # flush input (without relying on serial.flushInput())
+        self.rx_buf = bytearray()
         n = self.serial.inWaiting()
         while n > 0:
             self.serial.read(n)
@@ -379,15 +469,16 @@ class Pyboard:
 
     def raw_paste_write(self, command_bytes):
         # Read initial header, with window size.
-        data = self.serial.read(2)
+        data = self.read(2)
         window_size = data[0] | data[1] << 8
         window_remain = window_size
+        self.raw_paste_window = window_size
 
         # Write out the command_bytes data.
         i = 0
         while i < len(command_bytes):
-            while window_remain == 0 or self.serial.inWaiting():
-                data = self.serial.read(1)
+            while window_remain == 0 or self.in_waiting():
+                data = self.read(1)
                 if data == b"\x01":
                     # Device indicated that a new window of data can be sent.
                     window_remain += window_size
@@ -426,7 +517,7 @@ class Pyboard:
         if self.use_raw_paste:
             # Try to enter raw-paste mode.
             self.serial.write(b"\x05A\x01")
-            data = self.serial.read(2)
+            data = self.read(2)
             if data == b"R\x00":
                 # Device understood raw-paste command but doesn't support it.
                 pass
@@ -449,7 +540,7 @@ class Pyboard:
         self.serial.write(b"\x04")
 
         # check if we could exec command
-        data = self.serial.read(2)
+        data = self.read(2)
         if data != b"OK":
             raise PyboardError("could not exec command (response: %r)" % data)
 
@@ -514,6 +605,11 @@ class Pyboard:
         self.exec_("fr.close()\nfw.close()")
 
     def fs_get(self, src, dest, chunk_size=256, progress_callback=None):
+        if self.use_compression:
+            if self.fs_get_compressed(src, dest, chunk_size, progress_callback):
+                return
+            # The firmware can't deflate, fall back to a plain transfer for this file only
+            # since it may still be able to inflate for fs_put.
         if progress_callback:
             src_size = int(self.exec_("import os\nprint(os.stat('%s')[6])" % src))
             written = 0
@@ -537,7 +633,108 @@ class Pyboard:
                     progress_callback(written, src_size)
         self.exec_("f.close()")
 
+    def _put_frames(self, receiver_code, f, size, chunk_size, progress_callback):
+        self.exec_raw_no_follow(receiver_code)
+        ack = self.read(1)
+        if ack != b"\x01":
+            # receiver failed to start, e.g. the firmware has no sys.stdin.buffer
+            self.rx_buf[:0] = ack
+            self.follow(10)
+            return False
+        frame_size = (self.raw_paste_window or chunk_size) - 2
+        written = 0
+        while True:
+            data = f.read(frame_size)
+            self.serial.write(struct.pack("<H", len(data)) + data)
+            if not data:
+                break
+            ack = self.read(1)
+            if ack != b"\x01":
+                self.rx_buf[:0] = ack
+                ret, ret_err = self.follow(10)
+                raise PyboardError("exception", ret, ret_err)
+            if progress_callback:
+                written += len(data)
+                progress_callback(written, size)
+        ret, ret_err = self.follow(10)
+        if ret_err:
+            raise PyboardError("exception", ret, ret_err)
+        return True
+
+    def fs_put_bulk(self, src, dest, chunk_size=256, progress_callback=None):
+        """
+        Upload a file with a single exec: a receiver is started on the device which reads
+        length-prefixed binary frames from stdin and acknowledges each one with 0x01.  Frames
+        are sized to the raw-paste window, so the device never has more than one window of
+        data buffered.  Returns False if the device can't run the receiver.
+        """
+        with open(src, "rb") as f:
+            return self._put_frames(
+                _bulk_put_receiver_code % dest,
+                f,
+                os.path.getsize(src),
+                chunk_size,
+                progress_callback,
+            )
+
+    def fs_put_compressed(self, src, dest, chunk_size=256, progress_callback=None):
+        """
+        Like fs_put_bulk, but the file is deflated on the host and inflated on the device as
+        it is written.  Progress is reported in compressed bytes.  Returns False if the
+        firmware has no decompressor.
+        """
+        import io
+        import zlib
+
+        with open(src, "rb") as f:
+            c = zlib.compressobj(9, zlib.DEFLATED, COMPRESS_WBITS)
+            data = c.compress(f.read()) + c.flush()
+        return self._put_frames(
+            _compressed_put_receiver_code % dest,
+            io.BytesIO(data),
+            len(data),
+            chunk_size,
+            progress_callback,
+        )
+
+    def fs_get_compressed(self, src, dest, chunk_size=256, progress_callback=None):
+        """
+        Download a file which the device deflates and sends as base64 lines.  Returns False if
+        the firmware can't compress.
+        """
+        import binascii
+        import zlib
+
+        data = bytearray()
+        ret, ret_err = self.exec_raw(
+            _compressed_get_code % (chunk_size, src, COMPRESS_WBITS),
+            data_consumer=lambda d: data.extend(d),
+        )
+        if ret_err:
+            return False
+        try:
+            data = zlib.decompress(
+                b"".join(binascii.a2b_base64(line) for line in data.rstrip(b"\x04").split())
+            )
+        except (binascii.Error, zlib.error) as e:
+            raise PyboardError("fs_get: Could not interpret received data: %s" % str(e))
+        with open(dest, "wb") as f:
+            f.write(data)
+        if progress_callback:
+            progress_callback(len(data), len(data))
+        return True
+
     def fs_put(self, src, dest, chunk_size=256, progress_callback=None):
+        if self.use_compression:
+            if self.fs_put_compressed(src, dest, chunk_size, progress_callback):
+                return
+            # The firmware can't inflate, don't try again for this connection.
+            self.use_compression = False
+        if self.use_bulk_put:
+            if self.fs_put_bulk(src, dest, chunk_size, progress_callback):
+                return
+            # Don't try the bulk receiver again for this connection.
+            self.use_bulk_put = False
         if progress_callback:
             src_size = os.path.getsize(src)
             written = 0
@@ -649,6 +846,98 @@ def filesystem_command(pyb, args, progress_callback=None, verbose=False):
         sys.exit(1)
 
 
+_bulk_put_receiver_code = """\
+import sys, micropython
+r = sys.stdin.buffer.read
+w = sys.stdout.write
+f = open('%s', 'wb')
+micropython.kbd_intr(-1)
+try:
+  w('\\x01')
+  while 1:
+    n = r(2)
+    n = n[0] | n[1] << 8
+    if not n:
+      break
+    d = r(n)
+    w('\\x01')
+    f.write(d)
+finally:
+  micropython.kbd_intr(3)
+  f.close()
+"""
+
+
+# deflate window size (2**COMPRESS_WBITS bytes) used for compressed transfers, small enough
+# for the device to allocate
+COMPRESS_WBITS = 10
+
+_compressed_put_receiver_code = """\
+import sys, io, micropython
+try:
+  from deflate import DeflateIO, ZLIB
+  D = lambda s: DeflateIO(s, ZLIB)
+except ImportError:
+  from zlib import DecompIO
+  D = lambda s: DecompIO(s, %u)
+r = sys.stdin.buffer.read
+w = sys.stdout.write
+class F(io.IOBase):
+  n = 0
+  def ioctl(self, req, arg):
+    return 0
+  def readinto(self, b):
+    if not self.n:
+      h = r(2)
+      self.n = h[0] | h[1] << 8 or -1
+    if self.n < 0:
+      return 0
+    k = min(len(b), self.n)
+    b[:k] = r(k)
+    self.n -= k
+    if not self.n:
+      w('\\x01')
+    return k
+fr = F()
+b = bytearray(256)
+f = open('%%s', 'wb')
+micropython.kbd_intr(-1)
+try:
+  w('\\x01')
+  d = D(fr)
+  while 1:
+    n = d.readinto(b)
+    if not n:
+      break
+    f.write(memoryview(b)[:n])
+  while fr.readinto(b):
+    pass
+finally:
+  micropython.kbd_intr(3)
+  f.close()
+""" % COMPRESS_WBITS
+
+_compressed_get_code = """\
+import sys, io, ubinascii
+from deflate import DeflateIO, ZLIB
+class O(io.IOBase):
+  def ioctl(self, req, arg):
+    return 0
+  def write(self, b):
+    sys.stdout.write(ubinascii.b2a_base64(b).decode())
+    return len(b)
+b = bytearray(%u)
+with open('%s', 'rb') as f:
+  d = DeflateIO(O(), ZLIB, %u)
+  while 1:
+    n = f.readinto(b)
+    if not n:
+      break
+    d.write(memoryview(b)[:n])
+  d.close()
+"""
+
+
 _injected_import_hook_code = """\
 import uos, uio
 class _FS:
@@ -739,6 +1028,11 @@ def main():
         action="store_false",
         dest="exclusive",
     )
+    cmd_parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="deflate filesystem copies when the firmware supports it",
+    )
     cmd_parser.add_argument(
         "-f",
         "--filesystem",
@@ -757,6 +1051,7 @@ def main():
     except PyboardError as er:
         print(er)
         sys.exit(1)
+    pyb.use_compression = args.compress
 
     # run any command or file(s)
     if args.command is not None or args.filesystem or len(args.files):
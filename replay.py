@@ -0,0 +1,196 @@
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+import cycle  # noqa: E402
+import scheduler  # noqa: E402
+
+SAMPLE_RATE_HZ = 25  # Must match washing.SAMPLE_RATE_HZ
+SAMPLE_WINDOWS = 4  # Must match washing.SAMPLE_WINDOWS
+# Time awake per poll: connecting to the accelerometer, the discarded settling batch and sampling
+AWAKE_S = 1 + 1 + SAMPLE_WINDOWS
+# The old approach: notify a fixed time after the wake interrupt
+FIXED_DELAY_S = 40 * 60
+
+# Synthetic trace model, in mg per axis (the FIFO data is high-pass filtered, so no gravity)
+NOISE_MG = 1.0
+PUMP_MG = 3.0
+# The drum turns for TUMBLE_ON_S then rests for TUMBLE_OFF_S while washing and rinsing
+TUMBLE_ON_S = 12
+TUMBLE_OFF_S = 3
+
+
+class SyntheticTrace:
+    """
+    A made up wash: fill, wash (sometimes with a soak pause), drain and spin, then one or two
+    rinses. Samples are generated on demand for the times a poll looks at.
+    """
+
+    def __init__(self, seed):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.segments = []
+        self.end = 0
+        wash_mg = rng.uniform(25, 60)
+        self._add(rng.uniform(60, 180), 'quiet')
+        wash = rng.uniform(15, 35) * 60
+        if rng.random() < 0.5:
+            split = rng.uniform(0.3, 0.7)
+            self._add(wash * split, 'tumble', wash_mg)
+            self._add(rng.uniform(2, 12) * 60, 'quiet')
+            self._add(wash * (1 - split), 'tumble', wash_mg)
+        else:
+            self._add(wash, 'tumble', wash_mg)
+        self._add(rng.uniform(60, 120), 'pump')
+        self._add(rng.uniform(3, 6) * 60, 'spin', rng.uniform(150, 400))
+        for _ in range(rng.randint(1, 2)):
+            self._add(rng.uniform(60, 120), 'quiet')
+            self._add(rng.uniform(6, 10) * 60, 'tumble', wash_mg)
+            self._add(rng.uniform(60, 120), 'pump')
+            self._add(rng.uniform(3, 8) * 60, 'spin', rng.uniform(150, 400))
+        # The wake interrupt fires once the drum first turns
+        self.wake = self.segments[1][0]
+
+    def _add(self, duration, kind, amplitude=0.0):
+        self.segments.append((self.end, self.end + duration, kind, amplitude))
+        self.end += duration
+
+    def _segment(self, t):
+        for segment in self.segments:
+            if segment[0] <= t < segment[1]:
+                return segment
+        return (self.end, math.inf, 'quiet', 0.0)
+
+    def samples(self, t, count):
+        """
+        Return count samples from time t as a flat x, y, z list of raw accelerometer counts
+        """
+        rng = random.Random(hash((self.seed, round(t * SAMPLE_RATE_HZ))))
+        flat = []
+        for i in range(count):
+            now = t + i / SAMPLE_RATE_HZ
+            start, _, kind, amplitude = self._segment(now)
+            if kind == 'tumble' and (now - start) % (TUMBLE_ON_S + TUMBLE_OFF_S) >= TUMBLE_ON_S:
+                amplitude = 0.0
+            elif kind == 'pump':
+                amplitude = PUMP_MG
+            # Drum rotation around 1Hz when tumbling, faster when spinning
+            freq = 12.0 if kind == 'spin' else 1.1
+            for axis in range(3):
+                mg = amplitude * math.sin(2 * math.pi * freq * now + axis) + rng.gauss(0, NOISE_MG)
+                flat.append(max(-32768, min(32767, int(mg * cycle.COUNTS_PER_MG))))
+        return flat
+
+
+class RecordedTrace:
+    """
+    A trace recorded on the board: one "x,y,z" line of raw counts per sample at
+    SAMPLE_RATE_HZ, starting at the wake interrupt. end is the time the cycle finished, in
+    seconds, which has to be noted separately.
+    """
+
+    def __init__(self, filename, end):
+        self.seed = filename
+        self.wake = 0
+        self.end = end
+        self.data = []
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    self.data.extend(int(x) for x in line.split(','))
+
+    def samples(self, t, count):
+        start = int(t * SAMPLE_RATE_HZ) * 3
+        flat = self.data[start:start + count * 3]
+        return flat + [0] * (count * 3 - len(flat))
+
+
+def poll(trace, t, sensitivity):
+    """
+    Do what WashingMachine.is_vibrating does at time t
+    """
+    detector = cycle.detector_for_sensitivity(sensitivity, window_size=SAMPLE_RATE_HZ)
+    # Skip the batch thrown away while the filter settles
+    detector.add_samples(trace.samples(t + 1, SAMPLE_WINDOWS * SAMPLE_RATE_HZ))
+    return detector.is_active(SAMPLE_WINDOWS)
+
+
+def simulate(trace, sensitivity=2, **scheduler_args):
+    """
+    Replay the wakes of one cycle on a simulated clock. Returns (result, time of the last
+    poll, number of wakes)
+    """
+    s = scheduler.AdaptiveScheduler(**scheduler_args)
+    t = trace.wake + s.start()
+    wakes = 1
+    while True:
+        wakes += 1
+        result = s.update(poll(trace, t, sensitivity))
+        t += AWAKE_S
+        if result != scheduler.KEEP_POLLING:
+            return result, t, wakes
+        t += s.interval
+
+
+def summarise(traces, sensitivity, **scheduler_args):
+    premature = missed = wakes = 0
+    latencies = []
+    for trace in traces:
+        result, t, n = simulate(trace, sensitivity, **scheduler_args)
+        wakes += n
+        if result != scheduler.CYCLE_DONE:
+            missed += 1
+        elif t < trace.end:
+            premature += 1
+        else:
+            latencies.append(t - trace.end)
+    return premature, missed, latencies, wakes / len(traces)
+
+
+def print_row(name, premature, missed, latencies, wakes, runs):
+    mean = sum(latencies) / len(latencies) / 60 if latencies else float('nan')
+    worst = max(latencies) / 60 if latencies else float('nan')
+    print(f"{name:<24} {premature:>4}/{runs:<4} {missed:>4}/{runs:<4} {mean:>8.1f} {worst:>8.1f} {wakes:>6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay washing cycles through the cycle detector and polling scheduler.")
+    parser.add_argument("-n", "--runs", type=int, default=100, help="number of synthetic cycles")
+    parser.add_argument("-s", "--sensitivity", type=int, default=2, help="wake sensitivity (INT1_THS)")
+    parser.add_argument("--fractions", default="0.25,0.5,0.75,1",
+                        help="running thresholds to compare, as fractions of the wake threshold")
+    parser.add_argument("--quiet-times", default="1,5,10,15,20",
+                        help="minimum quiet times to compare before the cycle counts as done, in minutes")
+    parser.add_argument("--recorded", nargs=2, action="append", metavar=("FILE", "END_S"), default=[],
+                        help="also replay a recorded trace that finished END_S seconds after the wake")
+    args = parser.parse_args()
+
+    traces = [SyntheticTrace(seed) for seed in range(args.runs)]
+    traces += [RecordedTrace(filename, float(end)) for filename, end in args.recorded]
+    runs = len(traces)
+    print(f"{runs} cycles, {sum(t.end - t.wake for t in traces) / runs / 60:.0f} minutes long on average")
+    print(f"{'':<24} {'premature':>9} {'missed':>9} {'latency (min)':>17} {'wakes':>6}")
+    print(f"{'':<24} {'':>9} {'':>9} {'mean':>8} {'max':>8}")
+
+    fixed = [t.wake + FIXED_DELAY_S for t in traces]
+    late = [f - t.end for f, t in zip(fixed, traces) if f >= t.end]
+    print_row(f"fixed {FIXED_DELAY_S // 60} minute delay", runs - len(late), 0, late, 2, runs)
+
+    default_fraction = cycle.ACTIVE_FRACTION
+    for fraction in (float(x) for x in args.fractions.split(",")):
+        cycle.ACTIVE_FRACTION = fraction
+        active_mg, _ = cycle.thresholds_for_sensitivity(args.sensitivity)
+        row = summarise(traces, args.sensitivity)
+        print_row(f"running above {active_mg:g}mg", *row, runs)
+    cycle.ACTIVE_FRACTION = default_fraction
+
+    for minutes in (float(x) for x in args.quiet_times.split(",")):
+        row = summarise(traces, args.sensitivity, min_quiet_time=int(minutes * 60))
+        print_row(f"quiet for {minutes:g} minutes", *row, runs)
+
+
+if __name__ == "__main__":
+    main()
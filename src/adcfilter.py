@@ -0,0 +1,58 @@
+"""
+Filters for blocks of ADC readings
+"""
+
+MEAN = 0
+MEDIAN = 1
+TRIMMED_MEAN = 2
+
+
+def decimate(samples, factor):
+    """
+    Average each run of factor samples, returning len(samples) // factor values
+    """
+    if factor <= 1:
+        return list(samples)
+    values = []
+    for start in range(0, len(samples) - factor + 1, factor):
+        total = 0
+        for i in range(start, start + factor):
+            total += samples[i]
+        values.append(total / factor)
+    return values
+
+
+def median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def trimmed_mean(values, trim=0.25):
+    """
+    Mean after dropping the trim fraction of the lowest and of the highest values, so single
+    spikes don't move the result
+    """
+    ordered = sorted(values)
+    n = len(ordered)
+    k = int(n * trim)
+    if 2 * k >= n:
+        return median(ordered)
+    total = 0
+    for i in range(k, n - k):
+        total += ordered[i]
+    return total / (n - 2 * k)
+
+
+def filter_samples(samples, decimation=1, method=TRIMMED_MEAN, trim=0.25):
+    """
+    Decimate the samples and combine the decimated values into one reading with method
+    """
+    values = decimate(samples, decimation)
+    if method == MEDIAN:
+        return median(values)
+    if method == TRIMMED_MEAN:
+        return trimmed_mean(values, trim)
+    return sum(values) / len(values)
@@ -1,12 +1,18 @@
 import time
 
 import math
+from array import array
 from micropython import const
 from machine import Pin, ADC
+import adcfilter
 
 RGB_LED_PIN = const(48)
 LED_PIN = const(34)
 BATTERY_PIN = 10
+# Added to the battery voltage: raw read() values measured about this much too low. It hasn't been
+# checked against a meter with calibrated read_uv() values yet, so it's applied to those too until
+# it is (pass offset=0 to BatterySampler to compare)
+VOLTAGE_OFFSET = 0.185
 
 
 def update(existing_aggregate, new_value):
@@ -28,36 +34,65 @@ def finalize(existing_aggregate):
         return (mean, variance, sample_variance)
 
 
-def get_battery_voltage():
+class BatterySampler:
+    """
+    Reads the battery voltage. The ADC is set up once, and each reading fills a preallocated
+    array with samples reads, averages them in runs of decimation and combines the averages with
+    method (see adcfilter) so spikes are rejected. Calibrated read_uv() readings are used where
+    the port has them. offset is added to the battery voltage.
+    """
+
+    def __init__(self, pin=BATTERY_PIN, samples=16, decimation=2, method=adcfilter.TRIMMED_MEAN, trim=0.25,
+                 offset=VOLTAGE_OFFSET):
+        # Assign the ADC pin to read
+        self.adc = ADC(Pin(pin))
+        # We need to attenuate the input voltage so that we can read the full 0-3.3V range
+        self.adc.atten(ADC.ATTN_11DB)
+        self.calibrated = hasattr(self.adc, 'read_uv')
+        # Calibrated readings are stored in 100uV units so they fit in 16 bits
+        self.scale = 0.0001 if self.calibrated else 3.3 / 4096
+        self.samples = array('H', [0] * samples)
+        self.decimation = decimation
+        self.method = method
+        self.trim = trim
+        self.offset = offset
+
+    def fill(self):
+        samples = self.samples
+        if self.calibrated:
+            read_uv = self.adc.read_uv
+            for i in range(len(samples)):
+                samples[i] = read_uv() // 100
+        else:
+            read = self.adc.read
+            for i in range(len(samples)):
+                samples[i] = read()
+
+    def read_pin_voltage(self):
+        self.fill()
+        return adcfilter.filter_samples(self.samples, self.decimation, self.method, self.trim) * self.scale
+
+    def read(self):
+        """
+        Return (adc_value, battery voltage), adc_value being the pin voltage as a 12 bit reading
+        """
+        voltage = self.read_pin_voltage()
+        adc_value = voltage / 3.3 * 4096
+        wakeboard_voltage = voltage * 2  # Our voltage divider uses two 470k resistors to divide the value by two
+        return adc_value, wakeboard_voltage + self.offset
+
+
+_sampler = None
+
 
-    # Returns the current battery voltage.
-    # adc1 = ADC(Pin(BATTERY_PIN))  # Assign the ADC pin to read
-    # We need to attenuate the input voltage so that we can read the full 0-3.3V range
-    # adc1.atten(ADC.ATTN_11DB)
-    # for _ in range(10):
-    #     adc1.read()
-
-    # adc1_value = adc1.read()
-    # voltage1 = adc1_value / 4096 * 3.3
-    # s3voltage = voltage1 / (422000 / (160000 + 422000))
-    # return s3voltage
-
-    # Assign the ADC pin to read
-    adc = ADC(Pin(BATTERY_PIN))
-    # We need to attenuate the input voltage so that we can read the full 0-3.3V range
-    adc.atten(ADC.ATTN_11DB)
-
-    num_samples = 16
-    total_adc = 0
-    for x in range(num_samples):
-        total_adc += adc.read()
-
-    adc_value = total_adc / num_samples
-
-    voltage = adc_value / 4096 * 3.3
-    wakeboard_voltage = voltage * 2  # Our voltage divider uses two 470k resistors to divide the value by two
-    wakeboard_voltage += 0.185  # For some reason we tend to measure a voltage that is too low by about this much
-    return adc_value, wakeboard_voltage
+def get_battery_voltage():
+    """
+    Returns the current (adc_value, battery voltage)
+    """
+    global _sampler
+    if _sampler is None:
+        _sampler = BatterySampler()
+    return _sampler.read()
 
 
 def get_battery_percentage():
@@ -0,0 +1,125 @@
+import math
+from array import array
+
+# Detector states
+IDLE = 0
+RUNNING = 1
+SPINNING = 2
+DONE = 3
+
+STATE_NAMES = ('idle', 'running', 'spinning', 'done')
+
+# Raw accelerometer counts per mg in high resolution +-2g mode (12 bit data, left justified)
+COUNTS_PER_MG = 16
+# mg per unit of the LIS3DH INT1_THS register (the wake sensitivity) at +-2g
+INT1_THS_MG = 16
+# The running threshold is this fraction of the wake threshold: the machine had to shake past
+# the wake threshold to start polling, and tumbling pauses pull a window's RMS below its peak.
+# The spinning threshold is this multiple of it. Chosen with replay.py
+ACTIVE_FRACTION = 0.5
+SPIN_MULTIPLE = 4
+# Never go below this, the sensor's noise is around 2mg RMS at 25Hz
+MIN_ACTIVE_MG = 8
+
+
+class CycleDetector:
+    """
+    Works out whether a washing cycle is running, spinning or has finished from batches of
+    accelerometer samples (e.g. from Lis3dh.read_fifo). Samples are reduced to the RMS vibration
+    of fixed size windows, and only the last few window values are kept in a ring buffer, so
+    memory use doesn't depend on how long the cycle runs.
+    """
+
+    def __init__(self, window_size=32, active_mg=16, spin_mg=128, spin_windows=3,
+                 quiet_windows=10, history=16, counts_per_mg=COUNTS_PER_MG):
+        # Samples per window
+        self.window_size = window_size
+        # Window RMS above which the machine counts as running, kept in raw accelerometer units
+        self.active_rms = active_mg * counts_per_mg
+        # Mean RMS over the last spin_windows windows above which the machine counts as spinning
+        self.spin_rms = spin_mg * counts_per_mg
+        self.counts_per_mg = counts_per_mg
+        self.spin_windows = spin_windows
+        # Consecutive quiet windows after running before the cycle counts as done
+        self.quiet_windows = quiet_windows
+        self.rms_history = array('f', [0.0] * max(history, spin_windows))
+        self.reset()
+
+    def reset(self):
+        self.state = IDLE
+        self.windows = 0
+        self.quiet_count = 0
+        self._history_pos = 0
+        self._sum_squares = 0
+        self._count = 0
+        for i in range(len(self.rms_history)):
+            self.rms_history[i] = 0.0
+
+    def add_samples(self, samples):
+        """
+        Add a flat sequence of x, y, z samples and return the current state
+        """
+        sum_squares = self._sum_squares
+        count = self._count
+        for i in range(0, len(samples) - 2, 3):
+            x = samples[i]
+            y = samples[i + 1]
+            z = samples[i + 2]
+            sum_squares += x * x + y * y + z * z
+            count += 1
+            if count == self.window_size:
+                self._add_window(math.sqrt(sum_squares / count))
+                sum_squares = 0
+                count = 0
+        self._sum_squares = sum_squares
+        self._count = count
+        return self.state
+
+    def is_active(self, n):
+        """
+        Whether the mean RMS of the last n windows is above the running threshold
+        """
+        return self.recent_rms(n) >= self.active_rms
+
+    def recent_rms(self, n):
+        """
+        Mean RMS of the last n windows
+        """
+        size = len(self.rms_history)
+        n = min(n, size, self.windows)
+        if not n:
+            return 0.0
+        total = 0.0
+        for i in range(1, n + 1):
+            total += self.rms_history[(self._history_pos - i) % size]
+        return total / n
+
+    def _add_window(self, rms):
+        self.rms_history[self._history_pos] = rms
+        self._history_pos = (self._history_pos + 1) % len(self.rms_history)
+        self.windows += 1
+
+        if rms >= self.active_rms:
+            self.quiet_count = 0
+            if self.recent_rms(self.spin_windows) >= self.spin_rms:
+                self.state = SPINNING
+            else:
+                self.state = RUNNING
+        elif self.state in (RUNNING, SPINNING):
+            self.quiet_count += 1
+            if self.quiet_count >= self.quiet_windows:
+                self.state = DONE
+
+
+def thresholds_for_sensitivity(sensitivity):
+    """
+    Return (active_mg, spin_mg) for a wake sensitivity (the INT1_THS value)
+    """
+    wake_mg = sensitivity * INT1_THS_MG
+    active_mg = max(MIN_ACTIVE_MG, wake_mg * ACTIVE_FRACTION)
+    return active_mg, wake_mg * SPIN_MULTIPLE
+
+
+def detector_for_sensitivity(sensitivity, **kwargs):
+    active_mg, spin_mg = thresholds_for_sensitivity(sensitivity)
+    return CycleDetector(active_mg=active_mg, spin_mg=spin_mg, **kwargs)
@@ -1,4 +1,4 @@
-import network
+import wifi
 import requests
 import secrets
 import time
@@ -10,17 +10,8 @@ for i in range(10):
 
 
 def do_connect():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    if not wlan.isconnected():
-        print(f'Connecting to {secrets.WIFI_SSID}')
-        wlan.connect(secrets.WIFI_SSID, secrets.WIFI_PASSWORD)
-        loop = 0
-        while not wlan.isconnected():
-            print(f'Connecting... {loop}')
-            time.sleep(0.5)
-            loop += 1
-    print('network config:', wlan.ifconfig())
+    config, _ = wifi.connect(secrets.WIFI_SSID, secrets.WIFI_PASSWORD)
+    print('network config:', config)
 
 
 print("Starting now")
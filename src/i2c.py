@@ -3,24 +3,73 @@ from machine import I2C, Pin
 
 class I2CDevice:
 
+    # Bit to set in a register address so multi-byte reads auto-increment, if the device needs one
+    AUTO_INCREMENT = 0
+
     def __init__(self, id, scl, sda):
         self.id = id
         self.i2c = I2C(0, scl=Pin(scl), sda=Pin(sda), freq=100000)
+        # Scratch buffer for single register reads and writes so they don't allocate
+        self._reg_buf = bytearray(1)
+        # Last value known to be in each register, so redundant writes can be skipped
+        self._shadow = {}
 
     def read_reg(self, reg_addr):
         """
         Read a single byte from the given address
         """
-        return self.i2c.readfrom_mem(self.id, reg_addr, 1)[0]
+        self.i2c.readfrom_mem_into(self.id, reg_addr, self._reg_buf)
+        return self._reg_buf[0]
 
     def write_reg(self, reg_addr, data):
         """
-        Write a single byte to the given address
+        Write a single byte to the given address, unless the register is known to hold it already
+        """
+        if self._shadow.get(reg_addr) == data:
+            return
+        self._reg_buf[0] = data
+        self.i2c.writeto_mem(self.id, reg_addr, self._reg_buf)
+        self._shadow[reg_addr] = data
+
+    def write_regs(self, regs):
+        """
+        Write a sequence of (address, byte) pairs in order
         """
-        return self.i2c.writeto_mem(self.id, reg_addr, bytes([data]))
+        for reg_addr, data in regs:
+            self.write_reg(reg_addr, data)
 
     def read_data(self, addr, num_bytes):
         """
         Read multiple bytes from the given address
         """
         return self.i2c.readfrom_mem(self.id, addr, num_bytes)
+
+    def read_into(self, addr, buf):
+        """
+        Read len(buf) bytes from the given address into buf without allocating
+        """
+        self.i2c.readfrom_mem_into(self.id, addr, buf)
+
+    def load_shadow(self, addr, count):
+        """
+        Read count consecutive registers in one burst and remember their values
+        """
+        buf = bytearray(count)
+        self.read_into(addr | self.AUTO_INCREMENT, buf)
+        for i in range(count):
+            self._shadow[addr + i] = buf[i]
+
+    def shadow_matches(self, regs):
+        """
+        Check that the remembered values of a sequence of (address, byte) pairs match
+        """
+        for reg_addr, data in regs:
+            if self._shadow.get(reg_addr) != data:
+                return False
+        return True
+
+    def clear_shadow(self):
+        """
+        Forget all remembered register values, e.g. after the device has been reset
+        """
+        self._shadow = {}
@@ -0,0 +1,180 @@
+import json
+
+_WHITESPACE = b' \t\r\n'
+_LITERAL_END = b' \t\r\n,]}'
+
+# Scanner states
+_VALUE = 0    # Expecting a value
+_KEY = 1      # Expecting an object key or the end of the object
+_COLON = 2
+_AFTER = 3    # After a value, expecting ',' or the end of the container
+_STRING = 4
+_LITERAL = 5  # Number, true, false or null
+
+
+class JSONScanner:
+    """
+    Incremental JSON scanner. feed() it a document in pieces of any size and it calls
+    on_value(path, value) for every string, number, true, false and null in it, where path is the
+    list of object keys and array indexes leading to the value, e.g. ['result', 3, 'update_id'].
+    The path list is reused, so copy it to keep it.
+
+    Only values for which wanted(path) is true are decoded, everything else is skipped as it
+    streams past. Strings longer than max_string bytes are dropped. Memory use is fixed by
+    max_string and max_depth rather than the size of the document.
+    """
+
+    def __init__(self, on_value, wanted=None, max_string=256, max_depth=16):
+        self.on_value = on_value
+        self.wanted = wanted
+        self.max_depth = max_depth
+        self.buf = bytearray(max_string)
+        self.length = 0
+        self.path = []
+        self.containers = []
+        self.state = _VALUE
+        self.is_key = False
+        self.keep = False
+        self.escape = False
+
+    def feed(self, data):
+        data = bytes(data)
+        i = 0
+        n = len(data)
+        while i < n:
+            state = self.state
+            if state == _STRING:
+                i = self._string(data, i, n)
+                continue
+            c = data[i]
+            if state == _LITERAL:
+                if c in _LITERAL_END:
+                    # The delimiter is handled in the _AFTER state
+                    self._literal_end()
+                    continue
+                self._append(data, i, i + 1)
+                i += 1
+                continue
+            i += 1
+            if c in _WHITESPACE:
+                continue
+            if state == _VALUE:
+                if c == 0x22:  # "
+                    self._start(_STRING, False)
+                elif c == 0x7b:  # {
+                    self._push(c, None)
+                    self.state = _KEY
+                elif c == 0x5b:  # [
+                    self._push(c, 0)
+                elif c == 0x5d and self.containers and self.containers[-1] == 0x5b:
+                    # Empty array
+                    self._pop()
+                else:
+                    self._start(_LITERAL, False)
+                    self._append(data, i - 1, i)
+            elif state == _KEY:
+                if c == 0x22:
+                    self._start(_STRING, True)
+                elif c == 0x7d:  # }
+                    self._pop()
+                else:
+                    raise ValueError('Expected an object key')
+            elif state == _COLON:
+                if c != 0x3a:  # :
+                    raise ValueError("Expected ':'")
+                self.state = _VALUE
+            elif c == 0x2c:  # ,
+                if not self.containers:
+                    raise ValueError("Unexpected ','")
+                if self.containers[-1] == 0x5b:
+                    self.path[-1] += 1
+                    self.state = _VALUE
+                else:
+                    self.state = _KEY
+            elif c == 0x7d or c == 0x5d:
+                if not self.containers or self.containers[-1] != c - 2:
+                    raise ValueError('Unbalanced brackets')
+                self._pop()
+            else:
+                raise ValueError('Expected , } or ]')
+
+    def _push(self, container, key):
+        if len(self.containers) >= self.max_depth:
+            raise ValueError('JSON nested too deeply')
+        self.containers.append(container)
+        self.path.append(key)
+        self.state = _VALUE
+
+    def _pop(self):
+        self.containers.pop()
+        self.path.pop()
+        self.state = _AFTER
+
+    def _start(self, state, is_key):
+        self.state = state
+        self.is_key = is_key
+        self.length = 0
+        self.escape = False
+        self.keep = is_key or self.wanted is None or self.wanted(self.path)
+
+    def _append(self, data, start, end):
+        if not self.keep:
+            return
+        length = self.length + end - start
+        if length > len(self.buf):
+            self.keep = False
+            return
+        self.buf[self.length:length] = data[start:end]
+        self.length = length
+
+    def _string(self, data, i, n):
+        if self.escape:
+            self.escape = False
+            self._append(data, i, i + 1)
+            return i + 1
+        quote = data.find(b'"', i)
+        end = n if quote < 0 else quote
+        backslash = data.find(b'\\', i, end)
+        if backslash >= 0:
+            self._append(data, i, backslash + 1)
+            self.escape = True
+            return backslash + 1
+        self._append(data, i, end)
+        if quote < 0:
+            return n
+        self._string_end()
+        return quote + 1
+
+    def _string_end(self):
+        value = None
+        if self.keep:
+            raw = bytes(self.buf[:self.length])
+            value = raw.decode()
+            if '\\' in value:
+                value = json.loads('"' + value + '"')
+        if self.is_key:
+            # A key too long to keep can't match anything the caller wants
+            self.path[-1] = value
+            self.state = _COLON
+            return
+        self.state = _AFTER
+        if self.keep:
+            self.on_value(self.path, value)
+
+    def _literal_end(self):
+        self.state = _AFTER
+        if not self.keep:
+            return
+        raw = bytes(self.buf[:self.length]).decode()
+        if raw == 'true':
+            value = True
+        elif raw == 'false':
+            value = False
+        elif raw == 'null':
+            value = None
+        else:
+            try:
+                value = int(raw)
+            except ValueError:
+                value = float(raw)
+        self.on_value(self.path, value)
@@ -30,21 +30,32 @@ class Lis3dh(I2CDevice):
     REG_Y = 0x2A
     REG_Z = 0x2C
 
-    def __init__(self):
-        super().__init__(self.ID, self.SCL, self.SDA)
-        self.init()
-
-    def init(self):
-        print('Initialising accelerometer')
-        self.self_check()
-
-        self.write_reg(self.CTRL_REG5, 0x80)
-
-        time.sleep(0.1)
-
+    FIFO_CTRL_REG = 0x2E  # FIFO mode selection and watermark level
+    FIFO_SRC_REG = 0x2F  # FIFO watermark / overrun status and number of unread samples
+    FIFO_SIZE = 32
+    FIFO_MODE_BYPASS = 0x00
+    FIFO_MODE_STREAM = 0x80
+
+    # Output data rate codes for CTRL_REG1
+    ODR_1HZ = 0b0001
+    ODR_10HZ = 0b0010
+    ODR_25HZ = 0b0011
+    ODR_50HZ = 0b0100
+    ODR_100HZ = 0b0101
+
+    # Default INT1 threshold, as a multiple of 16mg
+    DEFAULT_SENSITIVITY = 2
+    # INT1_THS and INT1_DURATION are 7 bit values
+    MAX_SETTING = 0x7f
+
+    # Setting the top bit of a register address makes multi-byte reads auto-increment
+    AUTO_INCREMENT = 0x80
+
+    # Control registers written by init, in order
+    INIT_REGS = (
         # Set data rate to 1hz, low power mode off, enable X, Y and Z axes
         # 00100111
-        self.write_reg(self.CTRL_REG1, 0b00010111)
+        (CTRL_REG1, 0b00010111),
 
         # 1 - BDU: Block data update. This ensures that both the high and the low bytes for each
         #          16bit represent the same sample
@@ -53,36 +64,81 @@ class Lis3dh(I2CDevice):
         # 1 - HR: High resolution mode enabled.
         # 00 - ST1-ST0: Self test. Disabled
         # 0 - SIM: SPI serial interface mode. Default is 0
-        self.write_reg(self.CTRL_REG4, 0x88)
+        (CTRL_REG4, 0x88),
 
         # 2 Write 09h into CTRL_REG2 // High-pass filter enabled on data and interrupt1
         # 00001001
-        self.write_reg(self.CTRL_REG2, 0x09)
+        (CTRL_REG2, 0x09),
 
         # 3 Write 40h into CTRL_REG3 // Interrupt driven to INT1 pad
-        self.write_reg(self.CTRL_REG3, 0x40)
+        (CTRL_REG3, 0x40),
 
         # 4 Write 00h into CTRL_REG4 // FS = 2 g
         # 5 Write 08h into CTRL_REG5 // Interrupt latched
+    )
 
-        # // Threshold as a multiple of 16mg. 4 * 16 = 64mg
-        self.set_sensitivity(2)
+    # 9 Write 2Ah into INT1_CFG // Configure interrupt when any of the X, Y or Z axes exceeds
+    #   (rather than stay below) the threshold
+    INT1_CFG_VALUE = 0x2a
 
-        # Duration the acceleration must be above the threshold before triggering the
-        # interrupt. 50/1hz = 1s
-        self.set_duration(1)
+    def __init__(self):
+        super().__init__(self.ID, self.SCL, self.SDA)
+        # Room for a full FIFO of X, Y and Z samples so it can be drained in one burst
+        self.fifo_buf = bytearray(6 * self.FIFO_SIZE)
+        self.sample_buf = bytearray(6)
+        self.init()
+
+    def init(self):
+        print('Initialising accelerometer')
+        self.self_check()
+
+        # The chip keeps its configuration through deep sleep, so only reboot and rewrite it
+        # if it has been lost (e.g. after a brownout)
+        if self.config_applied():
+            print("Accelerometer already configured")
+        else:
+            # Always write the reboot bit, and forget the old register values since the reboot
+            # restores the defaults
+            self.clear_shadow()
+            self.write_reg(self.CTRL_REG5, 0x80)
+            self.clear_shadow()
+
+            time.sleep(0.1)
+
+            self.write_regs(self.INIT_REGS)
+
+            # // Threshold as a multiple of 16mg. 2 * 16 = 32mg
+            self.set_sensitivity(self.DEFAULT_SENSITIVITY)
+
+            # Duration the acceleration must be above the threshold before triggering the
+            # interrupt. 1/1hz = 1s
+            self.set_duration(1)
 
         # Read the reference register to set the reference acceleration values against which
-        # we compare current values for interrupt generation
+        # we compare current values for interrupt generation. This is needed on every wake, not
+        # just after a reboot, so the next interrupt compares against where the machine is now
         # 8 Read HP_FILTER_RESET
         self.read_reg(self.HP_FILTER_RESET)
 
-        # 9 Write 2Ah into INT1_CFG // Configure interrupt when any of the X, Y or Z axes exceeds
-        #   (rather than stay below) the threshold
-        self.write_reg(self.INT1_CFG, 0x2a)
+        # Skipped by the register shadow if the configuration was already applied
+        self.write_reg(self.INT1_CFG, self.INT1_CFG_VALUE)
 
         print("Accelerometer enabled")
 
+    def config_applied(self):
+        """
+        Check whether the chip still holds the configuration written by init. The CTRL registers,
+        the INT1 threshold and duration, and INT1_CFG are read in three bursts and also loaded
+        into the register shadow, so unchanged values aren't rewritten afterwards.
+        """
+        self.load_shadow(self.CTRL_REG1, 5)
+        self.load_shadow(self.INT1_THS, 2)
+        # Read INT1_CFG on its own: a burst from there would also read INT1_SRC and clear
+        # the interrupt
+        self.load_shadow(self.INT1_CFG, 1)
+        return (self.shadow_matches(self.INIT_REGS)
+                and self.shadow_matches(((self.CTRL_REG5, 0x00), (self.INT1_CFG, self.INT1_CFG_VALUE))))
+
     def self_check(self):
         who_am_i = self.read_reg(self.WHO_AM_I)
         if who_am_i != self.WHO_AM_I_ID:
@@ -97,9 +153,74 @@ class Lis3dh(I2CDevice):
         # interrupt. 5/1hz = 5s
         self.write_reg(self.INT1_DURATION, duration)
 
+    def set_data_rate(self, odr):
+        """
+        Set the output data rate, using the ODR codes from the datasheet (e.g. ODR_1HZ), keeping
+        low power mode off and the X, Y and Z axes enabled
+        """
+        self.write_reg(self.CTRL_REG1, (odr << 4) | 0b0111)
+
     def get_accel(self):
 
-        accel_data = self.read_data(self.REG_X | 0x80, 6)
-        x, y, z = struct.unpack('<hhh', accel_data)
+        self.read_into(self.REG_X | self.AUTO_INCREMENT, self.sample_buf)
+        x, y, z = struct.unpack('<hhh', self.sample_buf)
 
         print('Got accel data:', x, y, z)
+
+    def enable_fifo(self, watermark=FIFO_SIZE - 1, watermark_int1=False):
+        """
+        Enable the 32 sample FIFO in stream mode. The watermark bit in FIFO_SRC_REG is set (and,
+        if watermark_int1 is True, INT1 is raised) once more than watermark samples are stored.
+        Don't route the watermark to INT1 while INT1 is being used to wake from deep sleep.
+        """
+        self.write_reg(self.CTRL_REG5, 0x40)
+        # Switch through bypass mode to clear any old samples
+        self.write_reg(self.FIFO_CTRL_REG, self.FIFO_MODE_BYPASS)
+        self.write_reg(self.FIFO_CTRL_REG, self.FIFO_MODE_STREAM | (watermark & 0x1f))
+        ctrl3 = self.read_reg(self.CTRL_REG3)
+        if watermark_int1:
+            self.write_reg(self.CTRL_REG3, ctrl3 | 0x04)
+        else:
+            self.write_reg(self.CTRL_REG3, ctrl3 & ~0x04)
+
+    def disable_fifo(self):
+        self.write_reg(self.CTRL_REG3, self.read_reg(self.CTRL_REG3) & ~0x04)
+        self.write_reg(self.FIFO_CTRL_REG, self.FIFO_MODE_BYPASS)
+        self.write_reg(self.CTRL_REG5, 0x00)
+
+    def fifo_count(self):
+        src = self.read_reg(self.FIFO_SRC_REG)
+        if src & 0x40:
+            # Overrun: the FIFO is full and the oldest samples are being overwritten
+            return self.FIFO_SIZE
+        return src & 0x1f
+
+    def wait_for_watermark(self, timeout_ms=None, pin=None, poll_ms=10):
+        """
+        Wait until the FIFO reaches its watermark, either by watching pin (the pad the watermark
+        interrupt is routed to) or by polling FIFO_SRC_REG. Returns False on timeout.
+        """
+        start = time.ticks_ms()
+        while True:
+            if pin is not None:
+                if pin.value():
+                    return True
+            elif self.read_reg(self.FIFO_SRC_REG) & 0x80:
+                return True
+            if timeout_ms is not None and time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+                return False
+            time.sleep_ms(poll_ms)
+
+    def read_fifo(self):
+        """
+        Drain every stored sample in a single I2C burst. Returns a flat tuple of
+        x0, y0, z0, x1, y1, z1, ... which is empty if the FIFO is empty.
+        """
+        count = self.fifo_count()
+        if not count:
+            return ()
+        buf = memoryview(self.fifo_buf)[:6 * count]
+        # Setting the top bit of the address auto-increments it, and the address wraps from
+        # OUT_Z_H back to OUT_X_L so successive samples are read in one transaction
+        self.read_into(self.REG_X | self.AUTO_INCREMENT, buf)
+        return struct.unpack_from('<%dh' % (3 * count), buf)
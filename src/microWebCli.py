@@ -46,6 +46,69 @@ class MicroWebCli :
         def Apply(self, microWebCli) :
             microWebCli.Headers['Authorization'] = self._auth
 
+    # ============================================================================
+    # ===( Class DNSCache  )======================================================
+    # ============================================================================
+
+    class DNSCache :
+
+        # ------------------------------------------------------------------------
+
+        def __init__(self, filepath=None, ttlSec=6*3600) :
+            self._filepath = filepath
+            self._ttlSec   = ttlSec
+            self._entries  = { }
+            if filepath :
+                if not 'json' in globals() :
+                    import json
+                try :
+                    with open(filepath, 'r') as f :
+                        self._entries = json.load(f)
+                except :
+                    pass
+
+        # ------------------------------------------------------------------------
+
+        def _save(self) :
+            if self._filepath :
+                if not 'json' in globals() :
+                    import json
+                try :
+                    with open(self._filepath, 'w') as f :
+                        json.dump(self._entries, f)
+                except Exception as ex :
+                    print('Error to save DNS cache (%s)' % ex)
+
+        # ------------------------------------------------------------------------
+
+        def Get(self, host, port) :
+            if not 'time' in globals() :
+                from time import time
+            e   = self._entries.get('%s:%s' % (host, port))
+            now = time()
+            # The wall clock restarts from zero on a cold boot, leaving persisted expiries further
+            # away than the TTL, and then the entry's age is unknown
+            if e and now < e[2] <= now + self._ttlSec :
+                return (e[0], e[1])
+            return None
+
+        # ------------------------------------------------------------------------
+
+        def Set(self, host, port, addr) :
+            # Only IP address / port tuples can be saved
+            if not isinstance(addr, tuple) or len(addr) != 2 :
+                return
+            if not 'time' in globals() :
+                from time import time
+            self._entries['%s:%s' % (host, port)] = [addr[0], addr[1], int(time()) + self._ttlSec]
+            self._save()
+
+        # ------------------------------------------------------------------------
+
+        def Invalidate(self, host, port) :
+            if self._entries.pop('%s:%s' % (host, port), None) :
+                self._save()
+
     # ============================================================================
     # ===( Utils  )===============================================================
     # ============================================================================
@@ -105,6 +168,39 @@ class MicroWebCli :
 
     # ----------------------------------------------------------------------------
 
+    _dnsCache = None
+
+    @staticmethod
+    def SetDNSCache(dnsCache) :
+        MicroWebCli._dnsCache = dnsCache
+
+    # ----------------------------------------------------------------------------
+
+    _keepAlive      = False
+    _connPool       = { }
+    _connPoolPerKey = 2
+
+    @staticmethod
+    def SetKeepAlive(enabled=True, maxConnsPerHost=2) :
+        MicroWebCli._keepAlive      = enabled
+        MicroWebCli._connPoolPerKey = maxConnsPerHost
+        if not enabled :
+            MicroWebCli.CloseConnections()
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def CloseConnections() :
+        for key in MicroWebCli._connPool :
+            for conn in MicroWebCli._connPool[key] :
+                try :
+                    conn[0].close()
+                except :
+                    pass
+        MicroWebCli._connPool = { }
+
+    # ----------------------------------------------------------------------------
+
     def GETRequest(url, queryParams=None, auth=None, connTimeoutSec=10, socks5Addr=None) :
         c = MicroWebCli(url, auth=auth, connTimeoutSec=connTimeoutSec, socks5Addr=socks5Addr)
         if queryParams :
@@ -184,6 +280,9 @@ class MicroWebCli :
         self._socket        = None
         self._socketAddr    = None
         self._response      = None
+        self._reused        = False
+        self._retryArgs     = None
+        self._noResponse    = False
 
     # ============================================================================
     # ===( Functions )============================================================
@@ -207,7 +306,8 @@ class MicroWebCli :
         qs   = self.QueryString
         if qs != '' :
             path = path + '?' + qs
-        self._write('%s %s HTTP/1.0\r\n' % (self.Method, path))
+        ver = 'HTTP/1.1' if MicroWebCli._keepAlive else 'HTTP/1.0'
+        self._write('%s %s %s\r\n' % (self.Method, path, ver))
 
     # ------------------------------------------------------------------------
 
@@ -221,14 +321,81 @@ class MicroWebCli :
 
     # ------------------------------------------------------------------------
 
-    def OpenRequest( self,
-                     data           = None,
-                     contentType    = None,
-                     contentLength  = None ) :
-        if self._socket :
-            raise Exception('Request is already opened')
-        if not self.URL :
-            raise Exception('No URL defined')
+    def _connectAddr(self, addr) :
+        cli = socket.socket( socket.AF_INET,
+                             socket.SOCK_STREAM,
+                             socket.IPPROTO_TCP )
+        try :
+            cli.settimeout(self.ConnTimeoutSec)
+            cli.connect(addr)
+        except :
+            cli.close()
+            raise
+        self._socketAddr = addr
+        return cli
+
+    # ------------------------------------------------------------------------
+
+    def _connect(self, host, port) :
+        cache = MicroWebCli._dnsCache
+        if cache :
+            addr = cache.Get(host, port)
+            if addr :
+                try :
+                    return self._connectAddr(addr)
+                except :
+                    # The cached address may be stale, resolve the host again
+                    cache.Invalidate(host, port)
+        addr = socket.getaddrinfo(host, port)[0][-1]
+        cli  = self._connectAddr(addr)
+        if cache :
+            cache.Set(host, port, addr)
+        return cli
+
+    # ------------------------------------------------------------------------
+
+    def _poolKey(self) :
+        return (self.Proto, self.Host, self.Port, self.Socks5Addr)
+
+    # ------------------------------------------------------------------------
+
+    def _takePooledConnection(self) :
+        conns = MicroWebCli._connPool.get(self._poolKey())
+        if conns :
+            cli, self._socketAddr = conns.pop()
+            return cli
+        return None
+
+    # ------------------------------------------------------------------------
+
+    def _releaseConnection(self) :
+        if not self._socket :
+            return
+        if not MicroWebCli._keepAlive :
+            self.Close()
+            return
+        conns = MicroWebCli._connPool.setdefault(self._poolKey(), [ ])
+        if len(conns) >= MicroWebCli._connPoolPerKey :
+            try :
+                conns.pop(0)[0].close()
+            except :
+                pass
+        conns.append((self._socket, self._socketAddr))
+        self._socket = None
+
+    # ------------------------------------------------------------------------
+
+    def _closePooledConnections(self) :
+        # They have been idle at least as long as one the server has closed
+        for conn in MicroWebCli._connPool.pop(self._poolKey(), [ ]) :
+            try :
+                conn[0].close()
+            except :
+                pass
+
+    # ------------------------------------------------------------------------
+
+    def _openConnection(self) :
         if self.Socks5Addr :
             if not isinstance(self.Socks5Addr, tuple) or len(self.Socks5Addr) != 2 :
                 raise Exception('"Socks5Addr" must be a tuple of (host, port)')
@@ -238,14 +405,8 @@ class MicroWebCli :
         else :
             host = self.Host
             port = self.Port
-        self._response = None
         try :
-            self._socketAddr = socket.getaddrinfo(host, port)[0][-1]
-            cli              = socket.socket( socket.AF_INET,
-                                              socket.SOCK_STREAM,
-                                              socket.IPPROTO_TCP )
-            cli.settimeout(self.ConnTimeoutSec)
-            cli.connect(self._socketAddr)
+            cli = self._connect(host, port)
         except :
             raise Exception('Error to connect to %s:%s' % (host, port))
         if self.Socks5Addr :
@@ -286,7 +447,44 @@ class MicroWebCli :
             except Exception as ex :
                 cli.close()
                 raise Exception('Error to open a secure SSL/TLS connection (%s)' % ex)
-        self._socket = cli
+        return cli
+
+    # ------------------------------------------------------------------------
+
+    def OpenRequest( self,
+                     data           = None,
+                     contentType    = None,
+                     contentLength  = None ) :
+        if self._socket :
+            raise Exception('Request is already opened')
+        if not self.URL :
+            raise Exception('No URL defined')
+        self._response   = None
+        self._reused     = False
+        self._retryArgs  = None
+        self._noResponse = False
+        if MicroWebCli._keepAlive :
+            self._socket = self._takePooledConnection()
+            self._reused = self._socket is not None
+            # Requests with a body written later by RequestWriteData can't be sent again
+            if data or not contentLength :
+                self._retryArgs = (data, contentType, contentLength)
+        if not self._socket :
+            self._socket = self._openConnection()
+        try :
+            self._writeRequest(data, contentType, contentLength)
+        except :
+            if not self._reused :
+                raise
+            # The server may have closed the idle connection, send it on a new one
+            self.Close()
+            self._reused = False
+            self._socket = self._openConnection()
+            self._writeRequest(data, contentType, contentLength)
+
+    # ------------------------------------------------------------------------
+
+    def _writeRequest(self, data, contentType, contentLength) :
         self._writeFirstLine()
         if data :
             contentLength = len(data)
@@ -306,6 +504,10 @@ class MicroWebCli :
             self._headers['Content-Length'] = contentLength
         else :
             self._headers.pop('Content-Length', None)
+        if MicroWebCli._keepAlive :
+            self._headers['Connection'] = 'keep-alive'
+        else :
+            self._headers.pop('Connection', None)
         self._headers['User-Agent'] = 'MicroWebCli by JC`zic'
         for h in self._headers :
             self._writeHeader(h, self._headers[h])
@@ -347,7 +549,16 @@ class MicroWebCli :
 
     def GetResponse(self) :
         if not self._response :
-            self._response = MicroWebCli._response(self, self._socket, self._socketAddr)
+            try :
+                self._response = MicroWebCli._response(self, self._socket, self._socketAddr)
+            except :
+                # Only send the request again if the server closed the idle connection without
+                # a byte of response, otherwise it may already have acted on it
+                if not self._reused or not self._retryArgs or not self._noResponse :
+                    raise
+                self._closePooledConnections()
+                self.OpenRequest(*self._retryArgs)
+                self._response = MicroWebCli._response(self, self._socket, self._socketAddr)
         return self._response
 
     # ------------------------------------------------------------------------
@@ -575,6 +786,11 @@ class MicroWebCli :
             self._headers       = { }
             self._contentType   = None
             self._contentLength = None
+            self._chunked       = False
+            self._remaining     = None
+            self._chunkRem      = 0
+            self._chunkStarted  = False
+            self._bodyDone      = False
             self._processResponse()
 
         # ------------------------------------------------------------------------
@@ -583,8 +799,14 @@ class MicroWebCli :
             try :
                 self._parseFirstLine()
                 self._parseHeader()
-                if self._contentLength == 0 :
-                    self.Close()
+                # The body length is tracked so the connection can be reused once it's read
+                if self._microWebCli.Method == 'HEAD' or self._code in (204, 304) :
+                    self._chunked   = False
+                    self._remaining = 0
+                elif not self._chunked :
+                    self._remaining = self._contentLength
+                if self._remaining == 0 :
+                    self._endBody()
             except :
                 self._microWebCli.Close()
                 raise Exception('Error to get response')
@@ -592,10 +814,13 @@ class MicroWebCli :
         # ------------------------------------------------------------------------
 
         def _parseFirstLine(self) :
-            self._httpVer, code, self._msg = self._socket.readline() \
-                                                         .decode()   \
-                                                         .strip()    \
-                                                         .split(' ', 2)
+            line = self._socket.readline()
+            if not line :
+                self._microWebCli._noResponse = True
+                raise Exception('Connection closed without a response')
+            self._httpVer, code, self._msg = line.decode()  \
+                                                 .strip()   \
+                                                 .split(' ', 2)
             self._code = int(code)
 
         # ------------------------------------------------------------------------
@@ -612,10 +837,75 @@ class MicroWebCli :
                     self._contentType   = self._headers.get("Content-Type", None)
                     ctLen               = self._headers.get("Content-Length", None)
                     self._contentLength = int(ctLen) if ctLen is not None else None
+                    te                  = self._headers.get("Transfer-Encoding", "")
+                    if 'chunked' in te.lower() :
+                        # The length of a chunked body is only known once it's read
+                        self._chunked       = True
+                        self._contentLength = None
                     break
 
         # ------------------------------------------------------------------------
 
+        def _nextChunkSize(self) :
+            # Chunk data is followed by CRLF before the size line of the next chunk
+            if self._chunkStarted :
+                self._socket.readline()
+            self._chunkStarted = True
+            size = int(self._socket.readline().split(b';', 1)[0].strip(), 16)
+            if size == 0 :
+                # Skip the trailer headers
+                while self._socket.readline().strip() :
+                    pass
+            return size
+
+        # ------------------------------------------------------------------------
+
+        def _readBodyInto(self, buf) :
+            if self._bodyDone :
+                return 0
+            n = len(buf)
+            if self._chunked :
+                if self._chunkRem == 0 :
+                    self._chunkRem = self._nextChunkSize()
+                    if self._chunkRem == 0 :
+                        self._endBody()
+                        return 0
+                n = min(n, self._chunkRem)
+            elif self._remaining is not None :
+                n = min(n, self._remaining)
+            x = self._socket.readinto(buf, n)
+            if not x :
+                if self._chunked or self._remaining is not None :
+                    raise Exception('Connection closed before the end of the content')
+                # Without a length the content ends when the server closes the connection
+                self._bodyDone = True
+                self.Close()
+                return 0
+            if self._chunked :
+                self._chunkRem -= x
+            elif self._remaining is not None :
+                self._remaining -= x
+                if self._remaining == 0 :
+                    self._endBody()
+            return x
+
+        # ------------------------------------------------------------------------
+
+        def _endBody(self) :
+            self._bodyDone = True
+            self._release()
+
+        # ------------------------------------------------------------------------
+
+        def _release(self) :
+            conn = self._headers.get('Connection', '').lower()
+            if conn == 'keep-alive' or (self._httpVer == 'HTTP/1.1' and conn != 'close') :
+                self._microWebCli._releaseConnection()
+            else :
+                self.Close()
+
+        # ------------------------------------------------------------------------
+
         def GetClient(self) :
             return self._microWebCli
 
@@ -683,16 +973,41 @@ class MicroWebCli :
 
         # ------------------------------------------------------------------------
 
+        def IsChunked(self) :
+            return self._chunked
+
+        # ------------------------------------------------------------------------
+
         def ReadContent(self, size=None) :
             try :
-                if size is None :
+                if self._bodyDone :
+                    return b''
+                if self._chunked :
+                    if size is None :
+                        b = bytearray()
+                        for chunk in self.IterContent() :
+                            b.extend(chunk)
+                        return bytes(b)
+                    buf = bytearray(size)
+                    x   = self.ReadContentInto(buf)
+                    return bytes(buf) if x == size else bytes(buf[:x])
+                if self._remaining is not None :
+                    if size is None or size > self._remaining :
+                        size = self._remaining
+                elif size is None :
                     b = self._socket.read()
+                    self._bodyDone = True
                     self.Close()
                     return b
-                elif size > 0 :
+                if size > 0 :
                     b = self._socket.read(size)
+                    if self._remaining is not None :
+                        self._remaining -= len(b)
                     if len(b) < size :
+                        self._bodyDone = True
                         self.Close()
+                    elif self._remaining == 0 :
+                        self._endBody()
                     return b
             except MemoryError as memEx :
                 self.Close()
@@ -706,15 +1021,36 @@ class MicroWebCli :
         def ReadContentInto(self, buf, nbytes=None) :
             if nbytes is None :
                 nbytes = len(buf)
-            if nbytes > 0 :
+            buf = memoryview(buf)[:nbytes]
+            n   = 0
+            try :
+                while n < nbytes :
+                    x = self._readBodyInto(buf[n:])
+                    if not x :
+                        break
+                    n += x
+            except :
+                self.Close()
+            return n
+
+        # ------------------------------------------------------------------------
+
+        def IterContent(self, buf=None) :
+            # Yields memoryviews of buf, each one is only valid until the next is read
+            if buf is None :
+                buf = MicroWebCli._tryAllocByteArray(1024)
+                if not buf :
+                    raise MemoryError('Not enough memory to allocate buffer')
+            buf = memoryview(buf)
+            while True :
                 try :
-                    x = self._socket.readinto(buf, nbytes)
-                    if x < nbytes :
-                        self.Close()
-                    return x
-                except :
+                    x = self._readBodyInto(buf)
+                except Exception as ex :
                     self.Close()
-            return 0
+                    raise Exception('Error to read response content (%s)' % ex)
+                if not x :
+                    return
+                yield buf[:x]
 
         # ------------------------------------------------------------------------
 
@@ -736,36 +1072,26 @@ class MicroWebCli :
             buf   = MicroWebCli._tryAllocByteArray(fSize if fSize and fSize < 1024 else 1024)
             if not buf :
                 raise MemoryError('Not enough memory to allocate buffer')
-            buf = memoryview(buf)
             try :
                 file = open(filepath, 'wb')
             except :
                 raise Exception('Error to create file (%s)' % filepath)
-            sizeRem = fSize
             pgrSize = 0
-            while sizeRem is None or sizeRem > 0 :
-                if sizeRem and sizeRem < len(buf) :
-                    buf = buf[:sizeRem]
-                x = self.ReadContentInto(buf)
-                if x == 0 :
-                    break
-                if x < len(buf) :
-                    buf = buf[:x]
-                if sizeRem :
-                    sizeRem -= x
-                try :
-                    file.write(buf)
-                except :
-                    break
-                pgrSize += x
-                if progressCallback :
-                    try :
-                        progressCallback(self, pgrSize, fSize)
-                    except Exception as ex :
-                        print('Error in progressCallback : %s' % ex)
+            try :
+                for chunk in self.IterContent(buf) :
+                    file.write(chunk)
+                    pgrSize += len(chunk)
+                    if progressCallback :
+                        try :
+                            progressCallback(self, pgrSize, fSize)
+                        except Exception as ex :
+                            print('Error in progressCallback : %s' % ex)
+            except :
+                pass
             file.close()
+            complete = self._bodyDone and (fSize is None or pgrSize == fSize)
             self.Close()
-            if sizeRem and sizeRem > 0 :
+            if not complete :
                 if not 'remove' in globals() :
                     from os import remove
                 remove(filepath)
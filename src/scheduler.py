@@ -0,0 +1,106 @@
+import struct
+
+# Result of AdaptiveScheduler.update
+KEEP_POLLING = 0
+CYCLE_DONE = 1
+FALSE_ALARM = 2
+
+
+class AdaptiveScheduler:
+    """
+    Decides how long to deep sleep between checks on a running wash. While the machine keeps
+    vibrating the interval doubles (up to max_interval), and once it goes quiet the interval drops
+    back to min_interval so the end of the cycle is confirmed quickly. Washes pause while filling,
+    draining and soaking, so the cycle only counts as done once it has stayed quiet for
+    min_quiet_time seconds. The state is packed into the RTC memory state store (see pack/unpack)
+    so it survives deep sleep.
+    """
+
+    MAGIC = 0x5D
+    # magic, flags, interval (s), quiet polls, polls, quiet time (s)
+    FORMAT = '<BBHBHH'
+    SIZE = struct.calcsize(FORMAT)
+    ACTIVE = 0x01
+    SEEN_VIBRATION = 0x02
+
+    def __init__(self, min_interval=60, first_interval=5 * 60, max_interval=16 * 60,
+                 done_quiet_polls=2, min_quiet_time=15 * 60, max_idle_polls=3):
+        self.min_interval = min_interval
+        self.first_interval = first_interval
+        self.max_interval = max_interval
+        # Consecutive quiet polls after vibrating before the cycle counts as done
+        self.done_quiet_polls = done_quiet_polls
+        # Seconds between the first and the last of those quiet polls
+        self.min_quiet_time = min_quiet_time
+        # Quiet polls without ever seeing vibration before giving up (e.g. the machine was bumped)
+        self.max_idle_polls = max_idle_polls
+        self.stop()
+
+    def stop(self):
+        self.active = False
+        self.seen_vibration = False
+        self.interval = self.first_interval
+        self.quiet_polls = 0
+        self.quiet_time = 0
+        self.polls = 0
+
+    def start(self):
+        """
+        Start polling after the wake interrupt. Returns the first interval in seconds
+        """
+        self.stop()
+        self.active = True
+        return self.interval
+
+    def update(self, vibrating):
+        """
+        Record the result of a poll and return KEEP_POLLING (sleep for self.interval seconds),
+        CYCLE_DONE or FALSE_ALARM. The scheduler stops itself in the last two cases.
+        """
+        self.polls += 1
+        if vibrating:
+            self.seen_vibration = True
+            self.quiet_polls = 0
+            self.quiet_time = 0
+            self.interval = min(self.interval * 2, self.max_interval)
+            return KEEP_POLLING
+
+        if self.quiet_polls:
+            # Quiet since the last poll too, so the whole interval slept counts
+            self.quiet_time = min(self.quiet_time + self.interval, 0xFFFF)
+            # Back off while it stays quiet, but don't overshoot the quiet time still needed
+            remaining = self.min_quiet_time - self.quiet_time
+            self.interval = max(self.min_interval, min(self.interval * 2, self.max_interval, remaining))
+        else:
+            self.interval = self.min_interval
+        self.quiet_polls = min(self.quiet_polls + 1, 0xFF)
+        if (self.seen_vibration and self.quiet_polls >= self.done_quiet_polls
+                and self.quiet_time >= self.min_quiet_time):
+            self.stop()
+            return CYCLE_DONE
+        if not self.seen_vibration and self.quiet_polls >= self.max_idle_polls:
+            self.stop()
+            return FALSE_ALARM
+        return KEEP_POLLING
+
+    def pack(self):
+        flags = (self.ACTIVE if self.active else 0) | (self.SEEN_VIBRATION if self.seen_vibration else 0)
+        return struct.pack(self.FORMAT, self.MAGIC, flags, self.interval, self.quiet_polls, self.polls,
+                           self.quiet_time)
+
+    def unpack(self, data):
+        """
+        Restore the state from pack(). Anything unrecognised leaves the scheduler stopped
+        """
+        self.stop()
+        if len(data) < self.SIZE:
+            return
+        magic, flags, interval, quiet_polls, polls, quiet_time = struct.unpack_from(self.FORMAT, data)
+        if magic != self.MAGIC:
+            return
+        self.active = bool(flags & self.ACTIVE)
+        self.seen_vibration = bool(flags & self.SEEN_VIBRATION)
+        self.interval = interval
+        self.quiet_polls = quiet_polls
+        self.polls = polls
+        self.quiet_time = quiet_time
@@ -0,0 +1,123 @@
+import struct
+from binascii import crc32
+import tracing
+from scheduler import AdaptiveScheduler
+
+# wifi.CACHE_SIZE, kept here because only timer wakes connect, so the other wakes needn't load
+# the wifi module
+WIFI_CACHE_SIZE = 27
+
+
+class StateStore:
+    """
+    Small state that has to survive deep sleep, kept in RTC memory as a packed struct with a
+    version byte and a CRC. RTC memory is lost on a cold boot, so the values that also have to
+    survive a power cycle are written through to flash, but only when they change. On a cold boot
+    they are read back from flash.
+    """
+
+    VERSION = 5
+    # version, sensitivity, duration, last telegram update id, scheduler state, wake timings,
+    # cached wifi access point and lease
+    FORMAT = '<BBBI%ds%ds%ds' % (AdaptiveScheduler.SIZE, tracing.SIZE, WIFI_CACHE_SIZE)
+    SIZE = struct.calcsize(FORMAT)
+
+    def __init__(self, rtc, settings_file='settings.json', update_id_file='lastupdateid.txt'):
+        self.rtc = rtc
+        self.settings_file = settings_file
+        self.update_id_file = update_id_file
+        self.sensitivity = None
+        self.duration = None
+        self.last_update_id = None
+        self.scheduler = b''
+        self.traces = b''
+        self.wifi = b''
+        if not self._load_rtc():
+            print('No saved state in RTC memory, loading from flash')
+            self._load_flash()
+            self._save_rtc()
+
+    def _load_rtc(self):
+        data = self.rtc.memory()
+        if len(data) < self.SIZE + 4:
+            return False
+        crc, = struct.unpack_from('<I', data, self.SIZE)
+        if crc != crc32(data[:self.SIZE]) or data[0] != self.VERSION:
+            return False
+        _, sensitivity, duration, last_update_id, scheduler, traces, wifi = struct.unpack_from(self.FORMAT, data)
+        # Zero means "not set" for all of these
+        self.sensitivity = sensitivity or None
+        self.duration = duration or None
+        self.last_update_id = last_update_id or None
+        self.scheduler = scheduler
+        self.traces = traces
+        self.wifi = wifi
+        return True
+
+    def _save_rtc(self):
+        data = struct.pack(self.FORMAT, self.VERSION, self.sensitivity or 0, self.duration or 0,
+                           self.last_update_id or 0, self.scheduler, self.traces,
+                           self.wifi)
+        self.rtc.memory(data + struct.pack('<I', crc32(data)))
+
+    def _load_flash(self):
+        try:
+            import json
+            with open(self.settings_file, 'r') as f:
+                settings = json.load(f)
+            self.sensitivity = settings['sensitivity']
+            self.duration = settings['duration']
+        except Exception as e:
+            print(f'Could not read {self.settings_file}', e)
+
+        try:
+            with open(self.update_id_file, 'r') as f:
+                self.last_update_id = int(f.readline())
+        except Exception as e:
+            print(f'Could not read {self.update_id_file}', e)
+
+    def set_settings(self, sensitivity, duration):
+        if sensitivity == self.sensitivity and duration == self.duration:
+            return
+        self.sensitivity = sensitivity
+        self.duration = duration
+        self._save_rtc()
+        import json
+        with open(self.settings_file, 'w') as f:
+            json.dump({'sensitivity': sensitivity, 'duration': duration}, f)
+
+    def set_last_update_id(self, last_update_id):
+        if last_update_id == self.last_update_id:
+            return
+        self.last_update_id = last_update_id
+        self._save_rtc()
+        with open(self.update_id_file, 'w') as f:
+            f.write(str(last_update_id))
+
+    def set_scheduler(self, scheduler):
+        """
+        Scheduler state only needs to survive deep sleep, so it's never written to flash
+        """
+        scheduler = scheduler + bytes(AdaptiveScheduler.SIZE - len(scheduler))
+        if scheduler == self.scheduler:
+            return
+        self.scheduler = scheduler
+        self._save_rtc()
+
+    def set_traces(self, traces):
+        """
+        Wake timings only need to survive deep sleep, so they're never written to flash
+        """
+        self.traces = traces
+        self._save_rtc()
+
+    def set_wifi(self, cache):
+        """
+        The cached access point and lease only need to survive deep sleep, so they're never
+        written to flash. An empty cache forgets them.
+        """
+        cache = cache + bytes(WIFI_CACHE_SIZE - len(cache))
+        if cache == self.wifi:
+            return
+        self.wifi = cache
+        self._save_rtc()
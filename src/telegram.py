@@ -1,6 +1,11 @@
 from microWebCli import MicroWebCli
 import secrets
 
+# Keep api.telegram.org's address across deep sleeps so it isn't resolved on every wake
+MicroWebCli.SetDNSCache(MicroWebCli.DNSCache('dnscache.json'))
+# Reuse the TLS connection for every request in a wake, the handshake is the slowest part
+MicroWebCli.SetKeepAlive(True)
+
 
 def get_bot():
     url = f'api.telegram.org/bot{secrets.TELEGRAM_API_KEY}/getMe'
@@ -16,46 +21,98 @@ def send_message(message):
     return MicroWebCli.JSONRequest(url, data)
 
 
-def get_messages():
-    # Get the id of the last update that we saw
-    last_update_filename = 'lastupdateid.txt'
-
-    try:
-        print(f"Opening file {last_update_filename}")
-        with open(last_update_filename, 'r') as f:
-            print(f"Opened file {last_update_filename}")
-            last_update_id = f.readline()
-    except Exception as e:
-        print(f"Error opening file {last_update_filename}", e)
-        last_update_id = None
-
-    print(f'Using last update id: {last_update_id}')
+class _LastUpdate:
+    """
+    Keeps the update id, message text and chat id of the last update in a getUpdates response
+    """
+
+    def __init__(self):
+        self.update_id = None
+        self.text = None
+        self.chat_id = None
+        self.index = None
+
+    def wanted(self, path):
+        return len(path) >= 3 and path[0] == 'result'
+
+    def __call__(self, path, value):
+        if path[1] != self.index:
+            # A new update, forget the fields of the previous one
+            self.index = path[1]
+            self.text = None
+            self.chat_id = None
+        depth = len(path)
+        if depth == 3 and path[2] == 'update_id':
+            self.update_id = value
+        elif depth >= 4 and path[2] == 'message':
+            if depth == 4 and path[3] == 'text':
+                self.text = value
+            elif depth == 5 and path[3] == 'chat' and path[4] == 'id':
+                self.chat_id = value
+
+
+def _get_updates(params, buf):
+    """
+    Call getUpdates with params and return the _LastUpdate of the response, or None on failure
+    """
+    from jsonscan import JSONScanner
 
     url = f'https://api.telegram.org/bot{secrets.TELEGRAM_API_KEY}/getUpdates'
+    print(f"Using data: {params}")
+    c = MicroWebCli(url, method='POST')
+    c.OpenRequestJSONData(params)
+    r = c.GetResponse()
+    if not r.IsSuccess():
+        print('getUpdates failed:', r.GetStatusCode())
+        r.Close()
+        return None
+
+    last = _LastUpdate()
+    scanner = JSONScanner(last, last.wanted)
+    for chunk in r.IterContent(buf):
+        scanner.feed(chunk)
+    return last
+
+
+def get_messages(state, limit=None, allowed_updates=('message',), latest_only=True):
+    """
+    Fetch new updates and return the last one as {'update_id', 'text', 'chat_id'}, or None if
+    there weren't any. The response is scanned as it arrives rather than parsed whole, so a long
+    backlog of updates doesn't need a big allocation.
+
+    With latest_only only the newest update is downloaded (offset -1) and everything up to it is
+    then acknowledged, so the request costs the same however long the board was asleep.
+    Otherwise up to limit updates after the last one seen are downloaded. allowed_updates limits
+    the types of update Telegram sends.
+    """
+    # Get the id of the last update that we saw
+    last_update_id = state.last_update_id
 
-    print(f"Using telegram url: {url}")
-
-    data = None
-    if last_update_id:
-        data = {"offset": int(last_update_id)}
-
-    print(f"Using data: {data}")
-
-    messages = MicroWebCli.JSONRequest(url, data)
-
-    print(f"Got messages: {messages}")
-
-    if messages is None:
-        messages = {}
-
-    if messages.get('result'):
-        last_message_update_id = messages['result'][-1].get('update_id')
-        if last_message_update_id:
-            new_last_message_update_id = last_message_update_id + 1
-            print('Setting last update id to:', new_last_message_update_id)
-            with open(last_update_filename, 'w') as f:
-                f.write(str(new_last_message_update_id))
-        else:
-            print('Did not find update_id in messages')
+    print(f'Using last update id: {last_update_id}')
 
-    return messages
+    params = {'allowed_updates': list(allowed_updates)}
+    if latest_only:
+        params['offset'] = -1
+    else:
+        if last_update_id:
+            params['offset'] = last_update_id
+        if limit:
+            params['limit'] = limit
+
+    buf = bytearray(512)
+    last = _get_updates(params, buf)
+    if last is None or last.update_id is None:
+        return None
+    if last_update_id and last.update_id < last_update_id:
+        # offset -1 returns the newest update even if it was already acknowledged
+        print('No new updates')
+        return None
+
+    new_last_update_id = last.update_id + 1
+    if latest_only:
+        # Acknowledge the newest update and everything before it
+        _get_updates({'offset': new_last_update_id, 'limit': 1,
+                      'allowed_updates': list(allowed_updates)}, buf)
+    print('Setting last update id to:', new_last_update_id)
+    state.set_last_update_id(new_last_update_id)
+    return {'update_id': last.update_id, 'text': last.text, 'chat_id': last.chat_id}
@@ -0,0 +1,117 @@
+import struct
+import time
+from array import array
+
+WAKES = 8  # Number of wakes kept
+SPANS = 8  # Spans kept per wake
+# Packed size: current wake index, span ids, span durations
+SIZE = 1 + WAKES * SPANS * 5
+
+# Span names are stored by their index in this list, so only ever append to it
+PHASES = ['awake', 'accel_init', 'blink', 'sample', 'wifi_connect', 'check_params', 'notify']
+
+
+class Tracer:
+    """
+    Records how long each phase of a wake takes, e.g.
+
+        with trace('wifi_connect'):
+            do_connect()
+
+    Durations (in microseconds) go into preallocated arrays holding the last WAKES wakes, which
+    can be packed into RTC memory so the history survives deep sleep.
+    """
+
+    def __init__(self):
+        self.ids = bytearray(WAKES * SPANS)
+        self.durations = array('I', [0] * (WAKES * SPANS))
+        self.wake = 0
+        self.span = 0
+
+    def new_wake(self):
+        """
+        Start recording a new wake, overwriting the oldest one
+        """
+        self.wake = (self.wake + 1) % WAKES
+        self.span = 0
+        base = self.wake * SPANS
+        for i in range(base, base + SPANS):
+            self.ids[i] = 0
+            self.durations[i] = 0
+
+    def record(self, name, us):
+        if self.span >= SPANS:
+            return
+        if name not in PHASES:
+            PHASES.append(name)
+        i = self.wake * SPANS + self.span
+        # Zero marks an empty slot
+        self.ids[i] = PHASES.index(name) + 1
+        self.durations[i] = us
+        self.span += 1
+
+    def __call__(self, name):
+        return _Span(self, name)
+
+    def wakes(self):
+        """
+        Return the recorded wakes, oldest first, each as a list of (name, microseconds)
+        """
+        wakes = []
+        for w in range(1, WAKES + 1):
+            base = ((self.wake + w) % WAKES) * SPANS
+            spans = []
+            for i in range(base, base + SPANS):
+                phase = self.ids[i]
+                if phase:
+                    name = PHASES[phase - 1] if phase <= len(PHASES) else str(phase - 1)
+                    spans.append((name, self.durations[i]))
+            if spans:
+                wakes.append(spans)
+        return wakes
+
+    def summary(self):
+        """
+        Mean and max milliseconds per phase over the recorded wakes
+        """
+        totals = {}
+        for spans in self.wakes():
+            for name, us in spans:
+                count, total, most = totals.get(name, (0, 0, 0))
+                totals[name] = (count + 1, total + us, max(most, us))
+        return ', '.join(f'{name} {total // count // 1000}/{most // 1000}ms'
+                         for name, (count, total, most) in totals.items())
+
+    def pack(self):
+        return bytes([self.wake]) + bytes(self.ids) + struct.pack('<%dI' % len(self.durations), *self.durations)
+
+    def unpack(self, data):
+        if len(data) != SIZE or data[0] >= WAKES:
+            return
+        n = WAKES * SPANS
+        self.wake = data[0]
+        self.ids[:] = data[1:1 + n]
+        durations = struct.unpack_from('<%dI' % n, data, 1 + n)
+        for i in range(n):
+            self.durations[i] = durations[i]
+
+
+class _Span:
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.ticks_us()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.record(self.name, time.ticks_diff(time.ticks_us(), self.start))
+
+
+tracer = Tracer()
+
+
+def trace(name):
+    return tracer(name)
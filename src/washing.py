@@ -1,14 +1,13 @@
 import time
+BOOT_US = time.ticks_us()
+
 import machine
 from machine import Pin
 from micropython import const
-import esp32
-from lis3dh import Lis3dh
-import telegram
-import network
-import secrets
-import json
-import neopixel
+from tracing import trace, tracer
+# Everything else is imported where it is used, so each wake only loads what its path needs:
+# the networking modules (telegram, wifi, secrets) and the cycle detector only on a timer wake,
+# neopixel only when the RGB LED blinks
 
 
 RGB_LED_PIN = const(48)
@@ -16,21 +15,25 @@ LED_PIN = const(34)
 INT_PIN = const(17)
 BATTERY_EN_PIN = 14
 BATTERY_PIN = 10
-DELAY_BEFORE_NOTIFICATION = 40  # 40 mins
+SAMPLE_RATE_HZ = 25  # Accelerometer data rate while checking for vibration
+SAMPLE_WINDOWS = 4  # Number of one second windows to sample on each check
+
+
+def do_connect(state):
+    import wifi
+    import secrets
+    config, cache = wifi.connect(secrets.WIFI_SSID, secrets.WIFI_PASSWORD, state.wifi)
+    state.set_wifi(cache)
+    print('network config:', config)
 
 
-def do_connect():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    if not wlan.isconnected():
-        print(f'Connecting to {secrets.WIFI_SSID}')
-        wlan.connect(secrets.WIFI_SSID, secrets.WIFI_PASSWORD)
-        loop = 0
-        while not wlan.isconnected():
-            print(f'Connecting... {loop}')
-            time.sleep(0.5)
-            loop += 1
-    print('network config:', wlan.ifconfig())
+def forget_network(state):
+    """
+    Requests failed after connecting, possibly because the cached address is no longer ours, so
+    do a full join with DHCP on the next wake
+    """
+    print('Forgetting the cached access point and lease')
+    state.set_wifi(b'')
 
 
 class WashingMachine:
@@ -38,41 +41,48 @@ class WashingMachine:
     def __init__(self):
         self.led = Pin(LED_PIN, mode=Pin.OUT)
         self.led.on()
-        self.lis3dh = Lis3dh()
-        self.settings_file = 'settings.json'
+        from state import StateStore
+        self.state = StateStore(machine.RTC())
+        tracer.unpack(self.state.traces)
+        tracer.new_wake()
+        with trace('accel_init'):
+            from lis3dh import Lis3dh
+            self.lis3dh = Lis3dh()
+
+    def load_scheduler(self):
+        from scheduler import AdaptiveScheduler
+        scheduler = AdaptiveScheduler()
+        scheduler.unpack(self.state.scheduler)
+        return scheduler
 
     def load_settings(self):
-        try:
-            with open(self.settings_file, 'r') as f:
-                settings = json.load(f)
-        except Exception:
-            settings = {}
-
-        if settings:
-            sensitivity = settings['sensitivity']
-            duration = settings['duration']
+        sensitivity = self.state.sensitivity
+        duration = self.state.duration
+        if sensitivity and duration:
             print(f'Setting sensitivity to {sensitivity}, duration to {duration}')
             self.lis3dh.set_sensitivity(sensitivity)
             self.lis3dh.set_duration(duration)
 
     def save_settings(self, sensitivity, duration):
-        settings = {'sensitivity': sensitivity, 'duration': duration}
-        with open('settings.json', 'w') as f:
-            json.dump(settings, f)
+        self.state.set_settings(sensitivity, duration)
         self.load_settings()
 
     def print_accel(self):
         self.lis3dh.get_accel()
 
     def check_new_params(self):
-        do_connect()
-        messages = telegram.get_messages()
-
-        print('Got messages: ', messages)
-        if messages.get('result'):
-            last_message = messages['result'][-1]['message']
+        with trace('wifi_connect'):
+            do_connect(self.state)
+        import telegram
+        try:
+            with trace('check_params'):
+                last_message = telegram.get_messages(self.state)
+        except Exception:
+            forget_network(self.state)
+            raise
 
-            print('Last message:', last_message)
+        print('Last message:', last_message)
+        if last_message and last_message['text']:
             text = last_message['text']
             import re
             pattern = re.compile('/set ([0-9]+) ([0-9]+)')
@@ -80,43 +90,120 @@ class WashingMachine:
             if match:
                 sensitivity = int(match.group(1))
                 duration = int(match.group(2))
-                self.save_settings(sensitivity, duration)
+                # Zero means "not set" in the saved state, and the registers only hold 7 bits
+                limit = self.lis3dh.MAX_SETTING
+                if 1 <= sensitivity <= limit and 1 <= duration <= limit:
+                    self.save_settings(sensitivity, duration)
+                else:
+                    print(f'Ignoring {text}, both values must be from 1 to {limit}')
 
     def send_notification(self):
-        do_connect()
+        with trace('wifi_connect'):
+            do_connect(self.state)
         print('Sending notification...')
-        battery, battery_voltage = self.get_battery_percentage()
-        print('Battery:', battery)
-        result = telegram.send_message(f'Washing done! Battery {battery:.2f}% ({battery_voltage:.2f}V)')
+        import battery
+        _, battery_percentage, battery_voltage = battery.get_battery_percentage()
+        print('Battery:', battery_percentage)
+        import telegram
+        try:
+            with trace('notify'):
+                result = telegram.send_message(f'Washing done! Battery {battery_percentage:.2f}% ({battery_voltage:.2f}V)\n'
+                                               f'Wake timings (mean/max): {tracer.summary()}')
+        except Exception:
+            forget_network(self.state)
+            raise
         print(result)
 
     def sleep_before_notification(self):
-        self.sleep(DELAY_BEFORE_NOTIFICATION * 60 * 1000)
+        scheduler = self.load_scheduler()
+        interval = scheduler.start()
+        self.state.set_scheduler(scheduler.pack())
+        self.sleep(interval * 1000)
+
+    def is_vibrating(self):
+        """
+        Sample the accelerometer for a few seconds and check whether the machine is vibrating
+        """
+        from cycle import detector_for_sensitivity
+        # The running threshold follows the wake threshold so that the two stay consistent
+        detector = detector_for_sensitivity(self.state.sensitivity or self.lis3dh.DEFAULT_SENSITIVITY,
+                                            window_size=SAMPLE_RATE_HZ)
+        self.lis3dh.set_data_rate(self.lis3dh.ODR_25HZ)
+        self.lis3dh.enable_fifo(watermark=SAMPLE_RATE_HZ - 1)
+        try:
+            # Throw away the first batch while the high-pass filter settles after the rate change
+            self.lis3dh.wait_for_watermark(timeout_ms=2000)
+            self.lis3dh.read_fifo()
+            while detector.windows < SAMPLE_WINDOWS:
+                if not self.lis3dh.wait_for_watermark(timeout_ms=2000):
+                    print('Timed out waiting for accelerometer samples')
+                    break
+                detector.add_samples(self.lis3dh.read_fifo())
+        finally:
+            self.lis3dh.disable_fifo()
+            self.lis3dh.set_data_rate(self.lis3dh.ODR_1HZ)
+        print(f'Vibration RMS: {detector.recent_rms(SAMPLE_WINDOWS) / detector.counts_per_mg:.1f}mg')
+        return detector.is_active(SAMPLE_WINDOWS)
+
+    def poll_cycle(self):
+        """
+        Check whether the wash is still running. Goes back to sleep if it is, otherwise returns
+        True if a notification should be sent
+        """
+        from scheduler import KEEP_POLLING, CYCLE_DONE
+        scheduler = self.load_scheduler()
+        if not scheduler.active:
+            # No polling state (e.g. RTC memory was lost), so assume the cycle has finished
+            return True
+        with trace('sample'):
+            vibrating = self.is_vibrating()
+        result = scheduler.update(vibrating)
+        self.state.set_scheduler(scheduler.pack())
+        if result == KEEP_POLLING:
+            print(f'Machine still running, checking again in {scheduler.interval}s')
+            self.sleep(scheduler.interval * 1000)
+        elif result == CYCLE_DONE:
+            print('Machine has stopped')
+            return True
+        else:
+            print('Machine never started, not sending a notification')
+        return False
 
     def wait_for_next_wake(self):
+        import esp32
         wake1 = Pin(INT_PIN, mode=Pin.IN)
         esp32.wake_on_ext0(pin=wake1, level=esp32.WAKEUP_ANY_HIGH)
         self.sleep()
 
-    def sleep(self, time=None):
+    def sleep(self, sleep_ms=None):
         self.led.off()
-        print('Going to sleep')
-        if time is not None:
-            machine.deepsleep(time)
+        awake_us = time.ticks_diff(time.ticks_us(), BOOT_US)
+        tracer.record('awake', awake_us)
+        self.state.set_traces(tracer.pack())
+        print(f'Going to sleep after {awake_us // 1000}ms awake')
+        if sleep_ms is not None:
+            machine.deepsleep(sleep_ms)
         else:
             machine.deepsleep()
 
-    def blink(self, times):
+    def blink(self, times, rgb=True):
+        """
+        Blink the LED, and the RGB LED too unless rgb is False, which saves loading neopixel
+        """
         Pin(LED_PIN, Pin.OUT).on()
 
-        pixel = neopixel.NeoPixel(Pin(RGB_LED_PIN), 1)
-        pixel[0] = (0, 0, 255, 1)
-        pixel.write()
+        pixel = None
+        if rgb:
+            import neopixel
+            pixel = neopixel.NeoPixel(Pin(RGB_LED_PIN), 1)
+            pixel[0] = (0, 0, 255, 1)
+            pixel.write()
 
         for i in range(times):
             self.led.on()
-            pixel[0] = (0, 0, 255, 1)
-            pixel.write()
+            if pixel:
+                pixel[0] = (0, 0, 255, 1)
+                pixel.write()
             time.sleep(0.05)
             self.led.off()
             time.sleep(0.3)
@@ -124,20 +211,24 @@ class WashingMachine:
     def start(self):
 
         print('Device woke')
-        self.blink(1)
-
         reason = machine.wake_reason()
+        # Pin wakes come with every vibration that trips the interrupt, so they only blink the
+        # plain LED
+        rgb = reason != machine.PIN_WAKE
+        with trace('blink'):
+            self.blink(1, rgb)
 
         print('Got wake reason: ', reason)
         if reason == machine.TIMER_WAKE:
             self.blink(1)
             print('Woke due to timer')
-            print('Checking for new params')
-            self.check_new_params()
-            print('Sending notification')
-            self.send_notification()
+            if self.poll_cycle():
+                print('Checking for new params')
+                self.check_new_params()
+                print('Sending notification')
+                self.send_notification()
         elif reason == machine.PIN_WAKE:
-            self.blink(2)
+            self.blink(2, rgb)
             print('Woke due to interrupt')
             # self.check_new_params()
             # self.send_notification()
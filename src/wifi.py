@@ -0,0 +1,98 @@
+import struct
+import time
+# network is imported in connect() so the cache helpers can be used without loading it
+
+# bssid, channel, ip, netmask, gateway, dns, time the lease was obtained (time.time())
+CACHE_FORMAT = '<6sB4s4s4s4sI'
+CACHE_SIZE = struct.calcsize(CACHE_FORMAT)  # state.WIFI_CACHE_SIZE has to match
+# The address is reused without asking the DHCP server, so stop reusing it well before a typical
+# home router's 24 hour lease would expire. Lower this if the router's leases are shorter.
+LEASE_TTL_S = 12 * 60 * 60
+
+
+def _ip_bytes(ip):
+    return bytes(int(x) for x in ip.split('.'))
+
+
+def _ip_str(ip):
+    return '.'.join(str(x) for x in ip)
+
+
+def wait_connected(wlan, timeout_ms, poll_ms=10):
+    start = time.ticks_ms()
+    while not wlan.isconnected():
+        if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+            return False
+        time.sleep_ms(poll_ms)
+    return True
+
+
+def _cached(cache, lease_ttl_s):
+    """
+    Unpack cache, or return None if it's empty or the lease is too old to reuse
+    """
+    if len(cache) != CACHE_SIZE or cache == bytes(CACHE_SIZE):
+        return None
+    fields = struct.unpack(CACHE_FORMAT, cache)
+    # The RTC keeps time through deep sleep, but a clock that went backwards can't be trusted
+    age = time.time() - fields[-1]
+    if not 0 <= age < lease_ttl_s:
+        print('Cached lease has expired')
+        return None
+    return fields
+
+
+def connect(ssid, password, cache=b'', timeout_ms=15000, fast_timeout_ms=2000, lease_ttl_s=LEASE_TTL_S):
+    """
+    Connect to the given network and return (ifconfig, cache). cache is the value returned by a
+    previous call (keep it in RTC memory); when valid the access point's BSSID and channel and the
+    last DHCP lease are reused, which skips the scan and DHCP. A lease is reused for at most
+    lease_ttl_s seconds after it was obtained. If the cached connection doesn't connect within
+    fast_timeout_ms, a full scan and join is done instead. Raises an Exception if the full join
+    doesn't connect within timeout_ms.
+    """
+    import network
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    if wlan.isconnected():
+        return wlan.ifconfig(), cache
+
+    cached = _cached(cache, lease_ttl_s)
+    if cached:
+        bssid, channel, ip, netmask, gateway, dns, _ = cached
+        print(f'Connecting to {ssid} using cached access point and address {_ip_str(ip)}')
+        wlan.ifconfig((_ip_str(ip), _ip_str(netmask), _ip_str(gateway), _ip_str(dns)))
+        try:
+            wlan.config(channel=channel)
+        except Exception:
+            pass
+        wlan.connect(ssid, password, bssid=bssid)
+        if wait_connected(wlan, fast_timeout_ms):
+            return wlan.ifconfig(), cache
+        print('Cached connection failed, doing a full join')
+        wlan.disconnect()
+        try:
+            wlan.ifconfig('dhcp')
+        except Exception:
+            pass
+
+    # Pick the strongest access point for the network so its BSSID and channel can be cached
+    best = None
+    for net in wlan.scan():
+        if net[0] == ssid.encode() and (best is None or net[3] > best[3]):
+            best = net
+
+    print(f'Connecting to {ssid}')
+    if best:
+        wlan.connect(ssid, password, bssid=best[1])
+    else:
+        wlan.connect(ssid, password)
+    if not wait_connected(wlan, timeout_ms):
+        wlan.disconnect()
+        raise Exception(f'Timed out connecting to {ssid}')
+
+    config = wlan.ifconfig()
+    cache = b''
+    if best:
+        cache = struct.pack(CACHE_FORMAT, best[1], best[2], *(_ip_bytes(x) for x in config), int(time.time()))
+    return config, cache
@@ -0,0 +1,39 @@
+"""
+Runs the board code on CPython: src is put on the path, the MicroPython-only modules come from
+tests/fakes, and time's MicroPython extensions (ticks_ms, sleep_ms, ...) run on the simulated
+clock in fakes/machine.py.
+"""
+import os
+import sys
+import time
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [os.path.join(HERE, 'fakes'), os.path.join(ROOT, 'src'), os.path.join(ROOT, 'batteryserver'), ROOT]
+
+import machine  # noqa: E402
+
+
+def _sleep_us(us):
+    machine.advance(us)
+
+
+time.ticks_us = lambda: machine.now_us
+time.ticks_ms = lambda: machine.now_us // 1000
+time.ticks_diff = lambda end, start: end - start
+time.sleep_us = _sleep_us
+time.sleep_ms = lambda ms: _sleep_us(ms * 1000)
+
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    """
+    A freshly powered board, running in an empty directory so settings files stay out of the tree
+    """
+    monkeypatch.chdir(tmp_path)
+    # pytest needs the real time.sleep, so it's only simulated while a test runs
+    monkeypatch.setattr(time, 'sleep', lambda s: _sleep_us(s * 1000000))
+    machine.reset()
+    return machine
@@ -0,0 +1,5 @@
+WAKEUP_ANY_HIGH = 1
+
+
+def wake_on_ext0(pin, level):
+    pass
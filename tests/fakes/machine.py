@@ -0,0 +1,201 @@
+"""
+Just enough of MicroPython's machine module to run the washing machine code on CPython.
+
+Time is simulated (see conftest.py, which points time.ticks_ms and friends here): deepsleep()
+advances the clock and raises DeepSleep, and the accelerometer's FIFO fills at its data rate from
+signal(t), a function of the simulated time returning raw (x, y, z) counts.
+"""
+
+TIMER_WAKE = 4
+PIN_WAKE = 2
+
+now_us = 0
+signal = None
+_wake_reason = 0
+_rtc_memory = b''
+
+
+class DeepSleep(Exception):
+
+    def __init__(self, sleep_ms):
+        super().__init__(sleep_ms)
+        self.sleep_ms = sleep_ms
+
+
+def reset(wake_reason=0, sample=None):
+    """
+    Power cycle the board: clears RTC memory and the accelerometer's registers
+    """
+    global now_us, signal, _wake_reason, _rtc_memory, _chip
+    now_us = 0
+    signal = sample
+    _wake_reason = wake_reason
+    _rtc_memory = b''
+    _chip = Lis3dhChip()
+
+
+def advance(us):
+    global now_us
+    now_us += int(us)
+
+
+def set_wake_reason(reason):
+    global _wake_reason
+    _wake_reason = reason
+
+
+def wake_reason():
+    return _wake_reason
+
+
+def deepsleep(sleep_ms=None):
+    if sleep_ms is not None:
+        advance(sleep_ms * 1000)
+    raise DeepSleep(sleep_ms)
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, id, mode=IN, *args, **kwargs):
+        self.id = id
+        self._value = 0
+
+    def value(self, *args):
+        if args:
+            self._value = args[0]
+        return self._value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class RTC:
+
+    def memory(self, *args):
+        global _rtc_memory
+        if args:
+            _rtc_memory = bytes(args[0])
+        return _rtc_memory
+
+
+class Lis3dhChip:
+    """
+    The LIS3DH registers and FIFO. Only what the Lis3dh driver uses is modelled.
+    """
+
+    WHO_AM_I = 0x0f
+    CTRL_REG1 = 0x20
+    CTRL_REG5 = 0x24
+    OUT_X_L = 0x28
+    FIFO_CTRL_REG = 0x2e
+    FIFO_SRC_REG = 0x2f
+    FIFO_SIZE = 32
+    # Output data rate codes in the top nibble of CTRL_REG1
+    RATES_HZ = {1: 1, 2: 10, 3: 25, 4: 50, 5: 100}
+
+    def __init__(self):
+        self.regs = bytearray(0x40)
+        self.regs[self.WHO_AM_I] = 0x33
+        self.fifo = []
+        self.sampled_us = 0
+        # ('read' or 'write', register address) of each access
+        self.accesses = []
+
+    def _streaming(self):
+        return self.regs[self.CTRL_REG5] & 0x40 and self.regs[self.FIFO_CTRL_REG] & 0x80
+
+    def _fill(self):
+        """
+        Add the samples taken since the last access, dropping the oldest once the FIFO is full
+        """
+        period_us = 1000000 // self.RATES_HZ.get(self.regs[self.CTRL_REG1] >> 4, 1)
+        while self.sampled_us + period_us <= now_us:
+            self.sampled_us += period_us
+            if self._streaming():
+                self.fifo.append(signal(self.sampled_us / 1000000) if signal else (0, 0, 0))
+                del self.fifo[:-self.FIFO_SIZE]
+
+    def read(self, addr, buf):
+        self._fill()
+        addr &= 0x7f
+        self.accesses.append(('read', addr))
+        if addr == self.FIFO_SRC_REG:
+            count = len(self.fifo)
+            watermark = self.regs[self.FIFO_CTRL_REG] & 0x1f
+            buf[0] = ((0x80 if count > watermark else 0) | (0x40 if count == self.FIFO_SIZE else 0)
+                      | (count & 0x1f))
+        elif addr == self.OUT_X_L:
+            import struct
+            for i in range(len(buf) // 6):
+                struct.pack_into('<hhh', buf, 6 * i, *(self.fifo.pop(0) if self.fifo else (0, 0, 0)))
+        else:
+            buf[:] = self.regs[addr:addr + len(buf)]
+
+    def write(self, addr, buf):
+        self._fill()
+        addr &= 0x7f
+        self.accesses.append(('write', addr))
+        self.regs[addr:addr + len(buf)] = buf
+        if addr == self.CTRL_REG5 and buf[0] & 0x80:
+            # Reboot: reload the defaults
+            accesses = self.accesses
+            self.__init__()
+            self.accesses = accesses
+        elif addr == self.FIFO_CTRL_REG and not buf[0] & 0x80:
+            # Bypass mode empties the FIFO
+            self.fifo = []
+
+
+_chip = Lis3dhChip()
+
+
+class RawADC:
+    """
+    An ADC on a port without read_uv(). Returns 12 bit readings of the pin voltages in microvolts
+    from RawADC.readings in turn, then repeats the last one.
+    """
+    ATTN_11DB = 3
+    readings = [1650000]
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.i = 0
+
+    def atten(self, atten):
+        pass
+
+    def _next_uv(self):
+        uv = self.readings[min(self.i, len(self.readings) - 1)]
+        self.i += 1
+        return uv
+
+    def read(self):
+        return min(4095, self._next_uv() * 4096 // 3300000)
+
+
+class ADC(RawADC):
+
+    def read_uv(self):
+        return self._next_uv()
+
+
+class I2C:
+
+    def __init__(self, id, scl=None, sda=None, freq=None):
+        self.id = id
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        _chip.read(memaddr, buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        buf = bytearray(nbytes)
+        _chip.read(memaddr, buf)
+        return bytes(buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        _chip.write(memaddr, buf)
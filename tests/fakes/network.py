@@ -0,0 +1,55 @@
+"""
+A WLAN that joins instantly and records what it was asked to do. Set WLAN.reachable to the
+BSSIDs that can be joined.
+"""
+
+STA_IF = 0
+
+
+class WLAN:
+    ACCESS_POINTS = [
+        (b'home', b'\x11\x22\x33\x44\x55\x01', 1, -70, 3, False),
+        (b'home', b'\x11\x22\x33\x44\x55\x02', 6, -50, 3, False),
+        (b'other', b'\x11\x22\x33\x44\x55\x03', 11, -40, 3, False),
+    ]
+    DHCP = ('192.168.1.23', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+    reachable = None
+    calls = []
+    _connected = False
+    _config = ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+
+    @classmethod
+    def reset(cls):
+        cls.reachable = [ap[1] for ap in cls.ACCESS_POINTS]
+        cls.calls = []
+        cls._connected = False
+        cls._config = cls.DHCP
+
+    def __init__(self, interface):
+        pass
+
+    def active(self, *args):
+        return True
+
+    def isconnected(self):
+        return WLAN._connected
+
+    def scan(self):
+        WLAN.calls.append('scan')
+        return list(self.ACCESS_POINTS)
+
+    def config(self, **kwargs):
+        WLAN.calls.append(('config', kwargs))
+
+    def connect(self, ssid, password, bssid=None):
+        WLAN.calls.append(('connect', bssid))
+        WLAN._connected = bssid is None or bssid in WLAN.reachable
+
+    def disconnect(self):
+        WLAN._connected = False
+
+    def ifconfig(self, *args):
+        if args:
+            WLAN.calls.append(('ifconfig', args[0]))
+            WLAN._config = self.DHCP if args[0] == 'dhcp' else args[0]
+        return WLAN._config
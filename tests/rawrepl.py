@@ -0,0 +1,191 @@
+"""
+A CPython stand-in for a MicroPython board's raw REPL, for pyboard.py's exec: and execpty:
+devices, e.g. exec:"python3 tests/rawrepl.py DIR". Code sent to it runs with DIR as the
+current directory and with just enough of micropython, deflate and the u-modules for
+pyboard.py's transfer code.
+"""
+import argparse
+import binascii
+import hashlib
+import io
+import os
+import sys
+import traceback
+import types
+import zlib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("dir", help="the board's filesystem")
+parser.add_argument("--pty", action="store_true", help="serve on a new pty and print its name to stderr, for execpty:")
+parser.add_argument("--window", type=int, default=128, help="raw-paste window size")
+parser.add_argument("--no-raw-paste", action="store_true", help="firmware without raw-paste mode")
+parser.add_argument("--no-stdin-buffer", action="store_true", help="firmware without sys.stdin.buffer")
+parser.add_argument("--no-deflate", action="store_true", help="firmware without the deflate module")
+parser.add_argument("--no-compress", action="store_true",
+                    help="deflate without compression support (no MICROPY_PY_DEFLATE_COMPRESS)")
+args = parser.parse_args()
+
+os.chdir(args.dir)
+if args.pty:
+    import tty
+
+    in_fd, slave = os.openpty()
+    tty.setraw(slave)
+    out_fd = in_fd
+    sys.stderr.write(os.ttyname(slave) + "\n")
+    sys.stderr.flush()
+else:
+    in_fd, out_fd = 0, 1
+
+
+def write(data):
+    if isinstance(data, str):
+        data = data.encode()
+    while data:
+        data = data[os.write(out_fd, data):]
+
+
+def read(n):
+    data = b""
+    while len(data) < n:
+        chunk = os.read(in_fd, n - len(data))
+        if not chunk:
+            sys.exit(0)
+        data += chunk
+    return data
+
+
+class DeflateIO:
+
+    def __init__(self, stream, format=0, wbits=0, close=False):
+        self.stream = stream
+        self.inflater = zlib.decompressobj()
+        self.deflater = None
+        self.pending = b""
+
+    def readinto(self, buf):
+        while not self.pending and not self.inflater.eof:
+            chunk = bytearray(64)
+            n = self.stream.readinto(chunk)
+            if not n:
+                break
+            self.pending += self.inflater.decompress(bytes(chunk[:n]))
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def write(self, data):
+        if args.no_compress:
+            raise OSError(95)
+        if self.deflater is None:
+            self.deflater = zlib.compressobj(9, zlib.DEFLATED, 10)
+        self.stream.write(self.deflater.compress(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if self.deflater:
+            self.stream.write(self.deflater.flush())
+
+
+micropython = types.ModuleType("micropython")
+micropython.kbd_intr = lambda c: None
+sys.modules.update(micropython=micropython, uos=os, ubinascii=binascii, uhashlib=hashlib, uio=io)
+if not args.no_deflate:
+    deflate = types.ModuleType("deflate")
+    deflate.ZLIB = 2
+    deflate.DeflateIO = DeflateIO
+    sys.modules["deflate"] = deflate
+os.ilistdir = lambda path="/": [(name, 0x4000 if os.path.isdir(name) else 0x8000, 0, os.stat(name).st_size)
+                                for name in os.listdir(".")]
+
+
+class Stdout:
+
+    def write(self, s):
+        write(s.replace("\n", "\r\n"))
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class Stdin:
+
+    class buffer:
+
+        @staticmethod
+        def read(n):
+            return read(n)
+
+        @staticmethod
+        def readinto(buf):
+            buf[:] = read(len(buf))
+            return len(buf)
+
+
+if args.no_stdin_buffer:
+    del Stdin.buffer
+
+
+def run(code):
+    stdout, stdin = sys.stdout, sys.stdin
+    sys.stdout, sys.stdin = Stdout(), Stdin
+    error = b""
+    try:
+        exec(code.decode(), namespace)
+    except SystemExit:
+        raise
+    except BaseException:
+        error = traceback.format_exc().encode()
+    sys.stdout, sys.stdin = stdout, stdin
+    write(b"\x04" + error + b"\x04>")
+
+
+def raw_paste():
+    write(b"R\x01" + bytes([args.window & 0xFF, args.window >> 8]) + b"\x01")
+    code = bytearray()
+    remain = args.window
+    while True:
+        c = read(1)
+        if c == b"\x04":
+            break
+        code += c
+        remain -= 1
+        if not remain:
+            remain = args.window
+            write(b"\x01")
+    write(b"\x04")
+    run(code)
+
+
+PROMPT = b"raw REPL; CTRL-B to exit\r\n>"
+namespace = {}
+raw = False
+code = bytearray()
+while True:
+    c = read(1)
+    if c == b"\x01":
+        raw = True
+        code = bytearray()
+        write(PROMPT)
+    elif c == b"\x02":
+        raw = False
+    elif not raw or (not code and c in b"\r\x03"):
+        pass
+    elif c == b"\x05" and not code:
+        read(2)
+        if args.no_raw_paste:
+            write(b"R\x00")
+        else:
+            raw_paste()
+    elif c == b"\x04":
+        if code:
+            write(b"OK")
+            run(code)
+            code = bytearray()
+        else:
+            namespace = {}
+            write(b"OK\r\nMPY: soft reboot\r\n" + PROMPT)
+    else:
+        code += c
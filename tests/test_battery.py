@@ -0,0 +1,74 @@
+import math
+import random
+
+import machine
+import pytest
+
+import adcfilter
+import battery
+
+
+def noisy_blocks(seed, blocks=500, size=16, spikes=2):
+    """
+    Blocks of 12 bit readings of a steady level with Gaussian noise and a few full scale spikes.
+    Yields (level, block)
+    """
+    rng = random.Random(seed)
+    for _ in range(blocks):
+        level = rng.uniform(1000, 3000)
+        block = [min(4095, max(0, round(rng.gauss(level, 8)))) for _ in range(size)]
+        for i in rng.sample(range(size), spikes):
+            block[i] = rng.choice([0, 4095])
+        yield level, block
+
+
+def mean_error(method, **kwargs):
+    errors = [abs(adcfilter.filter_samples(block, method=method, **kwargs) - level)
+              for level, block in noisy_blocks(1)]
+    return sum(errors) / len(errors)
+
+
+def test_spikes_are_rejected():
+    mean = mean_error(adcfilter.MEAN)
+    median = mean_error(adcfilter.MEDIAN)
+    trimmed = mean_error(adcfilter.TRIMMED_MEAN)
+    assert mean > 100
+    assert median < 10
+    assert trimmed < 10
+
+
+def test_trimmed_mean_is_a_mean_without_spikes():
+    values = [1, 2, 3, 4, 100, -100, 5, 6]
+    assert adcfilter.trimmed_mean(values, trim=0.125) == 3.5
+    assert adcfilter.trimmed_mean([7], trim=0.25) == 7
+
+
+def test_decimate():
+    assert adcfilter.decimate([1, 3, 5, 7, 9], 2) == [2, 6]
+    assert adcfilter.decimate([1, 2], 1) == [1, 2]
+
+
+@pytest.fixture
+def readings(monkeypatch):
+    def use(adc, values_uv):
+        monkeypatch.setattr(adc, 'readings', values_uv)
+        monkeypatch.setattr(battery, 'ADC', adc)
+    return use
+
+
+@pytest.mark.parametrize('adc', [machine.ADC, machine.RawADC])
+def test_sampler_rejects_spikes_and_keeps_the_offset(readings, adc):
+    # 1.9V at the pin is 3.8V at the battery
+    values = [1900000] * 16
+    values[3] = 0
+    values[10] = 3300000
+    readings(adc, values)
+    _, voltage = battery.BatterySampler().read()
+    assert math.isclose(voltage, 3.8 + battery.VOLTAGE_OFFSET, abs_tol=0.005)
+
+
+def test_offset_can_be_turned_off(readings):
+    readings(machine.ADC, [1900000])
+    adc_value, voltage = battery.BatterySampler(offset=0).read()
+    assert math.isclose(voltage, 3.8)
+    assert math.isclose(adc_value, 1.9 / 3.3 * 4096)
@@ -0,0 +1,41 @@
+import tracemalloc
+
+from i2c import I2CDevice
+
+
+def allocated(fn, repeat=20):
+    """
+    Bytes allocated while fn runs, freed or not, the least of a few calls after a warm up
+    """
+    fn()
+    tracemalloc.start()
+    try:
+        sizes = []
+        for _ in range(repeat):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            sizes.append(tracemalloc.get_traced_memory()[1] - current)
+        return min(sizes)
+    finally:
+        tracemalloc.stop()
+
+
+def test_hot_reads_allocate_no_more_than_the_bus(board):
+    device = I2CDevice(0x19, 36, 35)
+    one = bytearray(1)
+    six = bytearray(6)
+    # The fake chip allocates a little itself, so compare with reading straight from the bus
+    assert allocated(lambda: device.read_reg(0x0f)) <= allocated(
+        lambda: device.i2c.readfrom_mem_into(0x19, 0x0f, one))
+    assert allocated(lambda: device.read_into(0xa0, six)) <= allocated(
+        lambda: device.i2c.readfrom_mem_into(0x19, 0xa0, six))
+    # while read_data returns a new bytes object every call
+    assert allocated(lambda: device.read_data(0x20, 6)) > allocated(
+        lambda: device.i2c.readfrom_mem_into(0x19, 0x20, six))
+
+
+def test_unchanged_register_writes_do_not_allocate(board):
+    device = I2CDevice(0x19, 36, 35)
+    device.write_reg(0x20, 0x17)
+    assert allocated(lambda: device.write_reg(0x20, 0x17)) == 0
@@ -0,0 +1,72 @@
+import json
+import random
+
+import pytest
+
+from jsonscan import JSONScanner
+
+
+def random_value(rng, depth=0):
+    r = rng.random()
+    if depth > 4 or r < 0.4:
+        return rng.choice([1, -2.5e3, 0, 1e-7, True, False, None, 'a"b\\cé\n', '', 'x' * 5,
+                           12345678901, '☃ 😀'])
+    if r < 0.7:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {rng.choice(['k', 'k"2', 'é', '']) + str(i): random_value(rng, depth + 1)
+            for i in range(rng.randint(0, 4))}
+
+
+def flatten(value, path, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(item, path + [key], out)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            flatten(item, path + [i], out)
+    else:
+        out.append((tuple(path), value))
+    return out
+
+
+def scan(data, chunk_sizes=None, **kwargs):
+    values = []
+    scanner = JSONScanner(lambda path, value: values.append((tuple(path), value)), **kwargs)
+    i = 0
+    while i < len(data):
+        n = chunk_sizes() if chunk_sizes else len(data)
+        scanner.feed(memoryview(data)[i:i + n])
+        i += n
+    return values
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_json_loads_whatever_the_chunking(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        doc = {'result': random_value(rng)}
+        data = json.dumps(doc, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1])).encode()
+        expected = flatten(json.loads(data), [], [])
+        assert scan(data, lambda: rng.randint(1, 7)) == expected
+
+
+def test_only_wanted_values_are_decoded():
+    data = json.dumps({'ok': True, 'result': [{'update_id': 5, 'message': {'text': 'hi'}}]}).encode()
+    wanted = scan(data, wanted=lambda path: path[-1] == 'update_id')
+    assert wanted == [(('result', 0, 'update_id'), 5)]
+
+
+def test_long_strings_are_dropped():
+    data = json.dumps({'a': 'x' * 100, 'b': 'short'}).encode()
+    assert scan(data, max_string=10) == [(('b',), 'short')]
+
+
+@pytest.mark.parametrize('data', [b'{"a" 1}', b'{1: 2}', b'[1 2]', b'[1}', b'{"a": 1]]'])
+def test_malformed_documents_raise(data):
+    with pytest.raises(ValueError):
+        scan(data)
+
+
+def test_nesting_is_limited():
+    with pytest.raises(ValueError):
+        scan(b'[' * 20, max_depth=16)
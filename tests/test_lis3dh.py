@@ -0,0 +1,68 @@
+import time
+
+from lis3dh import Lis3dh
+
+
+def test_cold_boot_configures_the_chip(board):
+    Lis3dh()
+    chip = board._chip
+    assert ('write', Lis3dh.CTRL_REG5) in chip.accesses
+    assert chip.regs[Lis3dh.INT1_THS] == Lis3dh.DEFAULT_SENSITIVITY
+    assert chip.regs[Lis3dh.INT1_CFG] == Lis3dh.INT1_CFG_VALUE
+
+
+def test_wake_keeps_the_configuration_but_resets_the_reference(board):
+    Lis3dh()
+    chip = board._chip
+    chip.accesses = []
+
+    # a new instance on the next wake, the chip kept its registers through deep sleep
+    Lis3dh()
+
+    assert not [addr for kind, addr in chip.accesses if kind == 'write']
+    assert ('read', Lis3dh.HP_FILTER_RESET) in chip.accesses
+
+
+def streaming(board, watermark=31):
+    """
+    A configured accelerometer streaming 25Hz samples into its FIFO, each sample being its
+    index, its negation and 7
+    """
+    board.signal = lambda t: (round(t * 25), -round(t * 25), 7)
+    lis3dh = Lis3dh()
+    lis3dh.set_data_rate(Lis3dh.ODR_25HZ)
+    lis3dh.enable_fifo(watermark=watermark)
+    return lis3dh
+
+
+def samples(flat):
+    return [tuple(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+
+
+def test_read_fifo_when_empty(board):
+    lis3dh = streaming(board)
+    assert lis3dh.read_fifo() == ()
+
+
+def test_read_fifo_at_the_watermark(board):
+    lis3dh = streaming(board, watermark=24)
+    assert lis3dh.wait_for_watermark(timeout_ms=2000)
+
+    got = samples(lis3dh.read_fifo())
+
+    # The watermark is set once more than 24 samples are stored
+    assert len(got) == 25
+    first = got[0][0]
+    assert got == [(i, -i, 7) for i in range(first, first + 25)]
+    assert lis3dh.read_fifo() == ()
+
+
+def test_read_fifo_after_an_overrun_keeps_the_newest_samples(board):
+    lis3dh = streaming(board)
+    time.sleep_ms(2000)
+
+    got = samples(lis3dh.read_fifo())
+
+    assert len(got) == Lis3dh.FIFO_SIZE
+    newest = round(board.now_us / 1000000 * 25)
+    assert got == [(i, -i, 7) for i in range(newest - 31, newest + 1)]
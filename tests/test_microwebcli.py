@@ -0,0 +1,286 @@
+import io
+import time
+
+import pytest
+
+import microWebCli
+from microWebCli import MicroWebCli
+
+OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+# Chunk data may hold CRLFs, and sizes may have extensions
+CHUNKS = [b'hello', b', world', b' from a\r\nchunked', b' body']
+CHUNKED = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+           + b''.join(b'%x;name=value\r\n%s\r\n' % (len(c), c) for c in CHUNKS)
+           + b'0\r\nX-Checksum: 1234\r\nX-Other: trailer\r\n\r\n')
+CHUNKED_BODY = b''.join(CHUNKS)
+# The server had already closed the idle connection
+CLOSED = b''
+# Writing the request fails, e.g. the server reset the idle connection
+RESET = None
+
+
+class FakeSocket:
+    """
+    One connection to FakeServer. Each complete request written gets the next of replies.
+    """
+
+    def __init__(self, server, replies):
+        self.server = server
+        self.replies = replies
+        self.sent = bytearray()
+        self.rx = io.BytesIO()
+        self.closed = False
+
+    def settimeout(self, timeout):
+        pass
+
+    def connect(self, addr):
+        if addr in self.server.unreachable:
+            raise OSError(113)
+
+    def write(self, data):
+        if self.replies and self.replies[0] is RESET:
+            raise OSError(104)
+        self.sent += data
+        return len(data)
+
+    def _receive(self):
+        if self.sent:
+            reply = self.replies.pop(0) if self.replies else CLOSED
+            if reply:
+                self.server.handled.append(bytes(self.sent))
+            self.sent = bytearray()
+            self.rx = io.BytesIO(reply)
+
+    def readline(self):
+        self._receive()
+        return self.rx.readline()
+
+    def read(self, n=-1):
+        self._receive()
+        return self.rx.read(n)
+
+    def readinto(self, buf, n=None):
+        self._receive()
+        n = min(n or len(buf), self.server.max_read or len(buf))
+        return self.rx.readinto(memoryview(buf)[:n])
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer:
+    """
+    Stands in for the socket module. connections lists the replies for each new connection.
+    """
+    AF_INET = SOCK_STREAM = IPPROTO_TCP = 0
+
+    def __init__(self, *connections):
+        self.connections = [list(replies) for replies in connections]
+        self.sockets = []
+        self.handled = []
+        self.lookups = 0
+        self.unreachable = set()
+        # Most bytes a read returns, like a socket with only part of the response received
+        self.max_read = None
+
+    def getaddrinfo(self, host, port):
+        self.lookups += 1
+        return [(0, 0, 0, '', ('127.0.0.1', port))]
+
+    def socket(self, *args):
+        sock = FakeSocket(self, self.connections.pop(0))
+        self.sockets.append(sock)
+        return sock
+
+
+@pytest.fixture
+def server(monkeypatch):
+    def use(*connections):
+        fake = FakeServer(*connections)
+        monkeypatch.setattr(microWebCli, 'socket', fake)
+        return fake
+    # MicroPython's memoryview takes a str, CPython's doesn't
+    monkeypatch.setattr(microWebCli, 'memoryview',
+                        lambda data: memoryview(data.encode() if isinstance(data, str) else data),
+                        raising=False)
+    MicroWebCli.SetKeepAlive(True)
+    yield use
+    MicroWebCli.SetKeepAlive(False)
+
+
+def post(n):
+    c = MicroWebCli('http://example.com/post', method='POST')
+    c.OpenRequestJSONData({'n': n})
+    r = c.GetResponse()
+    return r.ReadContent()
+
+
+def test_connection_is_reused(server):
+    fake = server([OK, OK])
+    assert post(1) == b'ok'
+    assert post(2) == b'ok'
+    assert len(fake.sockets) == 1
+    assert len(fake.handled) == 2
+
+
+def test_idle_connection_closed_by_server_is_retried(server):
+    fake = server([OK, CLOSED], [OK])
+    post(1)
+    assert post(2) == b'ok'
+    assert len(fake.sockets) == 2
+    assert fake.sockets[0].closed
+    assert len(fake.handled) == 2
+
+
+def test_reset_idle_connection_is_closed_and_replaced(server):
+    fake = server([OK, RESET], [OK])
+    post(1)
+    assert post(2) == b'ok'
+    assert len(fake.sockets) == 2
+    assert fake.sockets[0].closed
+    assert len(fake.handled) == 2
+
+
+def test_partial_response_is_not_retried(server):
+    # The server got the request, so sending it again could post it twice
+    fake = server([OK, b'HTTP/1.1 2'], [OK])
+    post(1)
+    with pytest.raises(Exception):
+        post(2)
+    assert len(fake.sockets) == 1
+    assert len(fake.handled) == 2
+
+
+def test_retry_skips_other_idle_connections(server):
+    fake = server([OK, CLOSED], [OK, CLOSED], [OK])
+    a = MicroWebCli('http://example.com/a')
+    b = MicroWebCli('http://example.com/b')
+    a.OpenRequest()
+    b.OpenRequest()
+    a.GetResponse().ReadContent()
+    b.GetResponse().ReadContent()
+    # Both connections are pooled and both have been closed by the server
+    assert post(1) == b'ok'
+    assert len(fake.sockets) == 3
+    assert all(sock.closed for sock in fake.sockets[:2])
+
+
+def test_new_connection_is_not_retried(server):
+    fake = server([CLOSED], [OK])
+    with pytest.raises(Exception):
+        post(1)
+    assert len(fake.sockets) == 1
+
+
+@pytest.fixture
+def dns_cache(tmp_path):
+    cache = MicroWebCli.DNSCache(str(tmp_path / 'dnscache.json'))
+    MicroWebCli.SetDNSCache(cache)
+    yield cache
+    MicroWebCli.SetDNSCache(None)
+
+
+def test_dns_cache_set_and_get(dns_cache):
+    dns_cache.Set('example.com', 80, ('10.0.0.1', 80))
+    assert dns_cache.Get('example.com', 80) == ('10.0.0.1', 80)
+    assert dns_cache.Get('example.com', 443) is None
+    # Entries are saved, e.g. for the next wake
+    assert MicroWebCli.DNSCache(dns_cache._filepath).Get('example.com', 80) == ('10.0.0.1', 80)
+
+
+def test_dns_cache_entries_expire(dns_cache, monkeypatch):
+    now = time.time()
+    dns_cache.Set('example.com', 80, ('10.0.0.1', 80))
+    monkeypatch.setattr(time, 'time', lambda: now + dns_cache._ttlSec - 60)
+    assert dns_cache.Get('example.com', 80) == ('10.0.0.1', 80)
+    monkeypatch.setattr(time, 'time', lambda: now + dns_cache._ttlSec + 60)
+    assert dns_cache.Get('example.com', 80) is None
+
+
+def test_dns_cache_entries_are_dropped_when_the_clock_restarts(dns_cache, monkeypatch):
+    dns_cache.Set('example.com', 80, ('10.0.0.1', 80))
+    # A cold boot restarts the RTC from zero
+    monkeypatch.setattr(time, 'time', lambda: 5)
+    assert MicroWebCli.DNSCache(dns_cache._filepath).Get('example.com', 80) is None
+
+
+def test_cached_address_skips_the_lookup(server, dns_cache):
+    MicroWebCli.SetKeepAlive(False)
+    fake = server([OK], [OK])
+    assert post(1) == b'ok'
+    assert post(2) == b'ok'
+    assert len(fake.sockets) == 2
+    assert fake.lookups == 1
+
+
+def test_unreachable_cached_address_is_looked_up_again(server, dns_cache):
+    dns_cache.Set('example.com', 80, ('10.0.0.1', 80))
+    fake = server([], [OK])
+    fake.unreachable.add(('10.0.0.1', 80))
+    assert post(1) == b'ok'
+    assert fake.sockets[0].closed
+    assert fake.lookups == 1
+    assert dns_cache.Get('example.com', 80) == ('127.0.0.1', 80)
+    assert MicroWebCli.DNSCache(dns_cache._filepath).Get('example.com', 80) == ('127.0.0.1', 80)
+
+
+def get(buf_size=None):
+    c = MicroWebCli('http://example.com/get')
+    c.OpenRequest()
+    r = c.GetResponse()
+    if buf_size is None:
+        return r, r.ReadContent()
+    return r, b''.join(bytes(part) for part in r.IterContent(bytearray(buf_size)))
+
+
+def test_chunked_body(server):
+    server([CHUNKED])
+    r, body = get()
+    assert r.IsChunked()
+    assert r.GetContentLength() is None
+    assert body == CHUNKED_BODY
+
+
+@pytest.mark.parametrize('buf_size,max_read', [(3, None), (64, 2), (4, 3)])
+def test_chunks_split_across_reads(server, buf_size, max_read):
+    fake = server([CHUNKED])
+    fake.max_read = max_read
+    _, body = get(buf_size)
+    assert body == CHUNKED_BODY
+
+
+def test_chunked_body_read_in_pieces(server):
+    server([CHUNKED])
+    c = MicroWebCli('http://example.com/get')
+    c.OpenRequest()
+    r = c.GetResponse()
+    parts = []
+    while True:
+        part = r.ReadContent(6)
+        if not part:
+            break
+        parts.append(part)
+    assert b''.join(parts) == CHUNKED_BODY
+    assert max(len(part) for part in parts) == 6
+
+
+def test_trailers_are_skipped_and_the_connection_is_reused(server):
+    # The next response follows the trailers on the same connection
+    fake = server([CHUNKED, OK])
+    _, body = get()
+    assert body == CHUNKED_BODY
+    assert post(1) == b'ok'
+    assert len(fake.sockets) == 1
+    assert not fake.sockets[0].closed
+    assert len(fake.handled) == 2
+
+
+def test_partly_read_chunked_body_is_not_pooled(server):
+    fake = server([CHUNKED], [OK])
+    c = MicroWebCli('http://example.com/get')
+    c.OpenRequest()
+    assert c.GetResponse().ReadContent(5) == b'hello'
+    c.Close()
+    assert post(1) == b'ok'
+    assert len(fake.sockets) == 2
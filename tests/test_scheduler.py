@@ -0,0 +1,81 @@
+import replay
+from scheduler import AdaptiveScheduler, KEEP_POLLING, CYCLE_DONE, FALSE_ALARM
+
+
+def poll_until_done(s, polls):
+    """
+    Feed s the vibrating flags in polls, returning the results and the seconds slept before each
+    """
+    results = []
+    slept = [s.start()]
+    for vibrating in polls:
+        result = s.update(vibrating)
+        results.append(result)
+        if result != KEEP_POLLING:
+            break
+        slept.append(s.interval)
+    return results, slept
+
+
+def test_done_only_after_min_quiet_time():
+    s = AdaptiveScheduler(min_quiet_time=15 * 60)
+    results, slept = poll_until_done(s, [True] * 3 + [False] * 20)
+    assert results[-1] == CYCLE_DONE
+    # Time from the first quiet poll to the last one
+    assert sum(slept[4:len(results)]) >= 15 * 60
+    assert not s.active
+
+
+def test_two_quiet_polls_are_not_enough():
+    s = AdaptiveScheduler(min_quiet_time=15 * 60)
+    results, _ = poll_until_done(s, [True, False, False])
+    assert results == [KEEP_POLLING] * 3
+
+
+def test_quiet_intervals_back_off_without_overshooting():
+    s = AdaptiveScheduler(min_interval=60, max_interval=16 * 60, min_quiet_time=10 * 60)
+    s.start()
+    s.update(True)
+    intervals = []
+    while s.update(False) == KEEP_POLLING:
+        intervals.append(s.interval)
+    assert intervals == [60, 120, 240, 180]
+
+
+def test_vibration_resets_quiet_time():
+    s = AdaptiveScheduler(min_quiet_time=5 * 60)
+    results, _ = poll_until_done(s, [True, False, False, False, True, False, False])
+    assert results[-1] == KEEP_POLLING
+    assert s.quiet_time == 60
+
+
+def test_false_alarm():
+    s = AdaptiveScheduler(max_idle_polls=3)
+    results, _ = poll_until_done(s, [False] * 5)
+    assert results == [KEEP_POLLING, KEEP_POLLING, FALSE_ALARM]
+
+
+def test_pack_round_trip():
+    s = AdaptiveScheduler()
+    poll_until_done(s, [True, True, False, False])
+    restored = AdaptiveScheduler()
+    restored.unpack(s.pack())
+    assert len(s.pack()) == AdaptiveScheduler.SIZE
+    for name in ('active', 'seen_vibration', 'interval', 'quiet_polls', 'quiet_time', 'polls'):
+        assert getattr(restored, name) == getattr(s, name)
+
+
+def test_unpack_rejects_other_data():
+    s = AdaptiveScheduler()
+    s.unpack(bytes(AdaptiveScheduler.SIZE))
+    assert not s.active
+    s.unpack(b'\x5c')
+    assert not s.active
+
+
+def test_synthetic_cycles_are_not_reported_early():
+    # Fill, drain and soak pauses mustn't end the cycle
+    traces = [replay.SyntheticTrace(seed) for seed in range(50)]
+    premature, missed, latencies, _ = replay.summarise(traces, 2)
+    assert (premature, missed) == (0, 0)
+    assert max(latencies) < 40 * 60
@@ -0,0 +1,93 @@
+import math
+import sys
+import time
+import types
+
+import pytest
+
+import cycle
+import washing
+
+# Cycle timeline in seconds after the wake interrupt
+SOAK = (25 * 60, 35 * 60)
+END = 60 * 60
+
+
+def wash(t):
+    """
+    Vibration of a wash with a ten minute soak pause, as raw accelerometer counts
+    """
+    if t >= END or SOAK[0] <= t < SOAK[1]:
+        mg = 0.5 * math.sin(7 * t)
+    else:
+        mg = 40 * math.sin(2 * math.pi * 1.1 * t)
+    counts = int(mg * cycle.COUNTS_PER_MG)
+    return counts, -counts, counts
+
+
+def wake(board, reason):
+    """
+    Run the board from reset until it goes back to deep sleep, returning the sleep in ms
+    """
+    board.set_wake_reason(reason)
+    washing.BOOT_US = time.ticks_us()
+    with pytest.raises(board.DeepSleep) as sleep:
+        washing.run()
+    return sleep.value.sleep_ms
+
+
+@pytest.fixture
+def notifications(monkeypatch, board):
+    sent = []
+    monkeypatch.setattr(washing.WashingMachine, 'check_new_params', lambda self: None)
+    monkeypatch.setattr(washing.WashingMachine, 'send_notification',
+                        lambda self: sent.append(board.now_us / 1000000))
+    return sent
+
+
+def test_notifies_once_after_the_cycle_ends(board, notifications):
+    board.signal = wash
+    assert wake(board, board.PIN_WAKE) == 5 * 60 * 1000
+    wakes = 0
+    while not notifications:
+        wakes += 1
+        assert wakes < 50
+        sleep_ms = wake(board, board.TIMER_WAKE)
+    # Back to waiting for the next wake interrupt
+    assert sleep_ms is None
+    assert END <= notifications[0] < END + 30 * 60
+
+
+def test_bump_is_a_false_alarm(board, notifications):
+    board.signal = lambda t: (0, 0, 0)
+    wake(board, board.PIN_WAKE)
+    sleep_ms = 0
+    while sleep_ms is not None:
+        sleep_ms = wake(board, board.TIMER_WAKE)
+    assert notifications == []
+
+
+def test_lost_rtc_memory_notifies(board, notifications):
+    # No polling state after a timer wake, e.g. a brownout cleared RTC memory
+    assert wake(board, board.TIMER_WAKE) is None
+    assert len(notifications) == 1
+
+
+@pytest.mark.parametrize('text,saved', [
+    ('/set 5 3', (5, 3)),
+    ('/set 127 1', (127, 1)),
+    ('/set 0 3', (None, None)),
+    ('/set 128 3', (None, None)),
+    ('/set 5 300', (None, None)),
+])
+def test_set_command_range(board, monkeypatch, text, saved):
+    monkeypatch.setattr(washing, 'do_connect', lambda state: None)
+    monkeypatch.setitem(sys.modules, 'telegram',
+                        types.SimpleNamespace(get_messages=lambda state: {'text': text}))
+    washing_machine = washing.WashingMachine()
+
+    washing_machine.check_new_params()
+
+    assert (washing_machine.state.sensitivity, washing_machine.state.duration) == saved
+    # The wake's state can still be saved
+    washing_machine.state.set_traces(b'')
@@ -0,0 +1,83 @@
+import time
+
+import machine
+import network
+import pytest
+
+import wifi
+import state
+from state import StateStore
+
+
+@pytest.fixture
+def wlan(board):
+    network.WLAN.reset()
+    return network.WLAN
+
+
+def wake(wlan):
+    """
+    Deep sleep drops the connection
+    """
+    wlan._connected = False
+    wlan.calls = []
+
+
+def test_full_join_caches_the_strongest_access_point(wlan):
+    config, cache = wifi.connect('home', 'secret')
+    assert wlan.calls[0] == 'scan'
+    assert ('connect', b'\x11\x22\x33\x44\x55\x02') in wlan.calls
+    assert config == wlan.DHCP
+    assert len(cache) == wifi.CACHE_SIZE == state.WIFI_CACHE_SIZE
+
+
+def test_cached_join_skips_the_scan(wlan):
+    _, cache = wifi.connect('home', 'secret')
+    wake(wlan)
+    config, cached = wifi.connect('home', 'secret', cache)
+    assert 'scan' not in wlan.calls
+    assert ('ifconfig', wlan.DHCP) in wlan.calls
+    assert cached == cache
+
+
+def test_expired_lease_does_a_full_join(wlan, monkeypatch):
+    _, cache = wifi.connect('home', 'secret')
+    wake(wlan)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + wifi.LEASE_TTL_S)
+    _, renewed = wifi.connect('home', 'secret', cache)
+    assert wlan.calls[0] == 'scan'
+    assert renewed != cache
+
+
+def test_unreachable_access_point_does_a_full_join(wlan, monkeypatch):
+    _, cache = wifi.connect('home', 'secret')
+    wake(wlan)
+    wlan.reachable = [b'\x11\x22\x33\x44\x55\x01']
+    monkeypatch.setattr(wlan, 'ACCESS_POINTS', wlan.ACCESS_POINTS[:1])
+    _, cache = wifi.connect('home', 'secret', cache)
+    assert ('ifconfig', 'dhcp') in wlan.calls
+    assert 'scan' in wlan.calls
+    assert cache[:6] == b'\x11\x22\x33\x44\x55\x01'
+
+
+def test_state_keeps_the_cache_without_rewriting_rtc_memory(wlan):
+    state = StateStore(machine.RTC())
+    _, cache = wifi.connect('home', 'secret', state.wifi)
+    state.set_wifi(cache)
+
+    # Next wake
+    wake(wlan)
+    state = StateStore(machine.RTC())
+    assert state.wifi == cache
+    saved = machine.RTC().memory()
+    _, cache = wifi.connect('home', 'secret', state.wifi)
+    state.set_wifi(cache)
+    assert 'scan' not in wlan.calls
+    assert machine.RTC().memory() is saved
+
+    # Forgetting the cache forces a full join
+    state.set_wifi(b'')
+    wake(wlan)
+    wifi.connect('home', 'secret', StateStore(machine.RTC()).wifi)
+    assert wlan.calls[0] == 'scan'
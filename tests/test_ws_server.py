@@ -0,0 +1,138 @@
+import asyncio
+import socket
+import struct
+import time
+
+from wsframe import FrameDecoder, OP_BINARY
+from ws_server import BatteryServer
+
+UPGRADE = (b'GET / HTTP/1.1\r\nHost: board\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+           b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n')
+
+
+class Subscriber:
+    """
+    A websocket client recording when each broadcast sample arrives. Samples start with their
+    sequence number.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.received = []
+        self.arrived = {}
+        self.reading = asyncio.Event()
+        self.reading.set()
+        self.task = asyncio.create_task(self.run())
+
+    @classmethod
+    async def connect(cls, port, rcvbuf=None):
+        sock = socket.socket()
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=rcvbuf or 65536)
+        writer.write(UPGRADE)
+        assert (await reader.readuntil(b'\r\n\r\n')).startswith(b'HTTP/1.1 101')
+        return cls(reader, writer)
+
+    async def run(self):
+        decoder = FrameDecoder(max_payload=65536)
+        while True:
+            await self.reading.wait()
+            data = await self.reader.read(4096)
+            if not data:
+                return
+            for opcode, payload in decoder.feed(data):
+                assert opcode == OP_BINARY
+                seq, = struct.unpack_from('<I', payload)
+                self.received.append(seq)
+                self.arrived[seq] = time.perf_counter()
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+async def until(condition, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out'
+        await asyncio.sleep(0.005)
+
+
+async def start(count):
+    board = BatteryServer()
+    server = await asyncio.start_server(board.handle_client, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    subscribers = [await Subscriber.connect(port) for _ in range(count)]
+    await until(lambda: len(board.clients) == count)
+    return board, server, port, subscribers
+
+
+async def broadcast(board, samples, size, interval):
+    """
+    Broadcast samples of size bytes, returning when each was sent
+    """
+    sent = {}
+    for seq in range(samples):
+        sent[seq] = time.perf_counter()
+        board.broadcast(struct.pack('<I', seq) + bytes(size - 4), OP_BINARY)
+        await asyncio.sleep(interval)
+    return sent
+
+
+def latencies(sent, subscriber):
+    return [subscriber.arrived[seq] - sent[seq] for seq in subscriber.received]
+
+
+def test_broadcast_reaches_dozens_of_clients():
+    async def run():
+        board, server, _, subscribers = await start(50)
+        sent = await broadcast(board, 20, 64, 0.01)
+        await until(lambda: all(s.received[-1:] == [19] for s in subscribers))
+
+        for s in subscribers:
+            # Samples can only be skipped, never reordered
+            assert s.received == sorted(set(s.received))
+        worst = max(max(latencies(sent, s)) for s in subscribers)
+        assert worst < 0.5, 'worst broadcast latency %.1fms' % (worst * 1000)
+        assert sum(c.dropped for c in board.clients) == 0
+
+        for s in subscribers:
+            s.close()
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_slow_client_drops_stale_samples_without_holding_up_the_others():
+    async def run():
+        board, server, port, fast = await start(10)
+        slow = await Subscriber.connect(port, rcvbuf=4096)
+        await until(lambda: len(board.clients) == 11)
+        slow_client = board.clients[-1]
+        slow.reading.clear()
+
+        sent = await broadcast(board, 200, 32768, 0.002)
+        await until(lambda: all(s.received[-1:] == [199] for s in fast))
+
+        # The slow client's socket filled up, so it was only ever offered the newest sample
+        assert slow_client.dropped > 0
+        assert slow_client.pending is None or slow_client.pending[:4] == struct.pack('<I', 199)
+        for s in fast:
+            worst = max(latencies(sent, s))
+            assert worst < 0.5, 'worst broadcast latency %.1fms' % (worst * 1000)
+            assert len(s.received) > 150
+
+        # Once it catches up it gets the newest sample
+        slow.reading.set()
+        await until(lambda: slow.received[-1:] == [199])
+        assert len(slow.received) < 200
+
+        for s in fast + [slow]:
+            s.close()
+        server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import random
+
+import pytest
+
+from wsframe import (handshake, unmask, FrameDecoder, FrameWriter, OP_CONTINUATION, OP_TEXT,
+                     OP_BINARY, OP_PING)
+
+
+def frame(rng, opcode, payload, fin=True, masked=True, length_form=None):
+    """
+    Encode a frame as a browser would, optionally with a longer length form than needed
+    """
+    n = len(payload)
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    mask_bit = 0x80 if masked else 0
+    length_form = length_form or (0 if n < 126 else 1 if n < 65536 else 2)
+    if length_form == 0:
+        header.append(mask_bit | n)
+    elif length_form == 1:
+        header.append(mask_bit | 126)
+        header += n.to_bytes(2, 'big')
+    else:
+        header.append(mask_bit | 127)
+        header += n.to_bytes(8, 'big')
+    if masked:
+        key = rng.randbytes(4)
+        header += key
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return bytes(header) + payload
+
+
+def decode(decoder, stream, chunk_sizes):
+    got = []
+    i = 0
+    while i < len(stream):
+        n = chunk_sizes()
+        for opcode, payload in decoder.feed(stream[i:i + n]):
+            got.append((opcode, bytes(payload)))
+        i += n
+    return got
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_fuzz_fragmented_masked_messages_in_random_chunks(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        stream = b''
+        expected = []
+        for _ in range(rng.randint(1, 6)):
+            message = rng.randbytes(rng.randint(0, 900))
+            opcode = rng.choice([OP_TEXT, OP_BINARY])
+            parts = rng.randint(1, 4)
+            cuts = sorted(rng.randint(0, len(message)) for _ in range(parts - 1))
+            pieces = [message[a:b] for a, b in zip([0] + cuts, cuts + [len(message)])]
+            for j, piece in enumerate(pieces):
+                last = j == len(pieces) - 1
+                stream += frame(rng, opcode if j == 0 else OP_CONTINUATION, piece, fin=last,
+                                masked=rng.random() < 0.9, length_form=rng.choice([None, None, 1, 2]))
+                if last:
+                    expected.append((opcode, message))
+                if rng.random() < 0.3:
+                    # Pings can come between fragments
+                    ping = rng.randbytes(rng.randint(0, 125))
+                    stream += frame(rng, OP_PING, ping)
+                    expected.append((OP_PING, ping))
+        assert decode(FrameDecoder(), stream, lambda: rng.randint(1, 300)) == expected
+
+
+@pytest.mark.parametrize('stream', [
+    [(OP_CONTINUATION, b'x', True)],
+    [(OP_TEXT, b'a', False), (OP_BINARY, b'b', True)],
+    [(OP_PING, b'', False)],
+    [(OP_BINARY, bytes(2000), True)],
+    [(OP_TEXT, bytes(600), False), (OP_CONTINUATION, bytes(600), True)],
+])
+def test_protocol_errors_raise(stream):
+    rng = random.Random(0)
+    data = b''.join(frame(rng, opcode, payload, fin) for opcode, payload, fin in stream)
+    with pytest.raises(ValueError):
+        list(FrameDecoder(max_payload=1024).feed(data))
+
+
+@pytest.mark.parametrize('length', [0, 1, 3, 4, 31, 32, 33, 100, 1000])
+def test_unmask_matches_bytewise_xor(length):
+    rng = random.Random(length)
+    data = rng.randbytes(length)
+    mask = rng.randbytes(4)
+    buf = bytearray(data)
+    unmask(memoryview(buf), mask)
+    assert buf == bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+@pytest.mark.parametrize('length', [0, 125, 126, 65535, 65536])
+def test_frame_writer_round_trip(length):
+    stream = io.BytesIO()
+    payload = bytes(range(256)) * (length // 256) + bytes(length % 256)
+    FrameWriter(stream).write(payload, OP_BINARY)
+    decoder = FrameDecoder(max_payload=65536)
+    assert [(opcode, bytes(p)) for opcode, p in decoder.feed(stream.getvalue())] == [(OP_BINARY, payload)]
+
+
+def test_handshake_accept_key():
+    class Writer(io.BytesIO):
+        async def drain(self):
+            pass
+
+    async def run():
+        # The example from RFC 6455
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'GET /chat HTTP/1.1\r\nHost: server.example.com\r\nUpgrade: websocket\r\n'
+                         b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n')
+        return await handshake(reader, writer)
+
+    writer = Writer()
+    assert asyncio.run(run())
+    assert b'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n' in writer.getvalue()
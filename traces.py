@@ -0,0 +1,95 @@
+import argparse
+import ast
+import os
+import sys
+
+import pyboard
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+import tracing  # noqa: E402
+
+
+def fetch_traces(device):
+    """
+    Read the packed wake timings from the RTC memory of the board at device
+    """
+    buffer = bytearray()
+
+    def read_data(data):
+        buffer.extend(data.replace(b'\x04', b''))
+
+    cmd = """
+import machine
+from state import StateStore
+print(repr(StateStore(machine.RTC()).traces))
+    """
+    pyb = pyboard.Pyboard(device)
+    try:
+        pyb.enter_raw_repl(soft_reset=False)
+        pyb.exec_(cmd, data_consumer=read_data)
+        pyb.exit_raw_repl()
+    finally:
+        pyb.close()
+    return ast.literal_eval(buffer.decode("utf-8").strip().splitlines()[-1])
+
+
+def unpack_wakes(data):
+    tracer = tracing.Tracer()
+    tracer.unpack(data)
+    return tracer.wakes()
+
+
+def histograms(wakes):
+    """
+    Return {phase: {bucket: count}} where bucket is the power of two millisecond upper bound
+    """
+    result = {}
+    for spans in wakes:
+        for name, us in spans:
+            bucket = 1
+            while bucket * 1000 < us:
+                bucket *= 2
+            counts = result.setdefault(name, {})
+            counts[bucket] = counts.get(bucket, 0) + 1
+    return result
+
+
+def print_histograms(wakes):
+    print(f"{len(wakes)} wakes")
+    for name, counts in sorted(histograms(wakes).items()):
+        print()
+        print(name)
+        total = sum(counts.values())
+        for bucket in sorted(counts):
+            count = counts[bucket]
+            print(f"  <= {bucket:>6}ms {count:>4} {'#' * max(1, 40 * count // total)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate wake timings recorded on the board.")
+    parser.add_argument("-d", "--device", help="fetch the timings from this board")
+    parser.add_argument("-l", "--log", help="append fetched timings to this file")
+    parser.add_argument("files", nargs="*", help="files of previously logged timings to include")
+    args = parser.parse_args()
+
+    dumps = []
+    for filename in args.files:
+        with open(filename) as f:
+            dumps.extend(bytes.fromhex(line) for line in f if line.strip())
+    if args.device:
+        data = fetch_traces(args.device)
+        dumps.append(data)
+        if args.log:
+            with open(args.log, "a") as f:
+                f.write(data.hex() + "\n")
+    if not dumps:
+        parser.error("give a device to fetch from or files of logged timings")
+
+    wakes = []
+    for data in dumps:
+        wakes.extend(unpack_wakes(data))
+    print_histograms(wakes)
+
+
+if __name__ == "__main__":
+    main()